@@ -1,6 +1,8 @@
-from flask import Flask, render_template, request, redirect, flash, session, jsonify
-from datetime import date
+from flask import Flask, Response, render_template, stream_template, request, redirect, flash, session, jsonify, send_file, abort
+from datetime import date, datetime, timedelta
 import os
+import re
+import json
 import requests
 from dotenv import load_dotenv
 
@@ -11,8 +13,11 @@ from database import (
     get_user_by_username, create_user,
 
     # TODO
-    add_task, get_tasks, delete_task, toggle_task,
-    clear_completed, get_categories,
+    add_task, get_tasks, get_tasks_page, delete_task, toggle_task,
+    clear_completed, get_categories, TASK_PAGE_SIZE,
+
+    # FOCUS
+    add_focus_sessions, get_focus_trend, get_completions_by_day, get_focus_by_category,
 
     # CALENDAR
     add_event, get_events_for_user, get_events_for_date,
@@ -23,28 +28,167 @@ from database import (
     get_exp_categories, get_budget,
     get_totals_by_month, get_category_totals,
     get_monthly_summary, get_recent_transactions,
+    get_currencies, convert_amount, format_money, BASE_CURRENCY,
+
+    # BATCH & SYNC
+    apply_batch, BATCH_ENTITIES, get_changes, CHANGES_PAGE_SIZE, get_archived_years,
 
     # HELPERS
     get_current_month
 )
+from jobs import enqueue, get_job, job_status
+from live import hub, stream_enabled, HEARTBEAT_INTERVAL
+from assets import asset_url, send_asset, compress_response
+from reports import statement_path
 
 # -------------------- UTILS --------------------
 def get_previous_month(month):
     year, m = map(int, month.split("-"))
     return f"{year-1}-12" if m == 1 else f"{year}-{m-1:02d}"
 
+def _clean_batch_value(column, value):
+    """Coerce one batch field to its column type; raises ValueError if invalid."""
+    if value is None or value == "":
+        if column in ("task", "title", "amount", "type", "date"):
+            raise ValueError(f"{column} is required")
+        return None
+    if column == "amount":
+        return float(value)
+    if column in ("category_id", "important"):
+        return int(value)
+    if column == "type" and value not in ("income", "expense"):
+        raise ValueError("type must be 'income' or 'expense'")
+    if column == "priority" and value not in PRIORITY_LEVELS:
+        raise ValueError(f"priority must be one of {PRIORITY_LEVELS}")
+    if column in ("date", "due_date"):
+        date.fromisoformat(value)
+    if column == "currency":
+        value = str(value).upper()
+        if not CURRENCY_RE.fullmatch(value):
+            raise ValueError("currency must be a 3-letter ISO code")
+    return str(value)
+
+def validate_batch_op(op):
+    """
+    Normalize one /api/batch operation.
+    Returns (op, None) on success or (None, error message).
+    """
+    if not isinstance(op, dict):
+        return None, "operation must be an object"
+
+    kind, entity = op.get("op"), op.get("entity")
+    if entity not in BATCH_ENTITIES:
+        return None, f"unknown entity {entity!r}"
+    if kind not in ("create", "update", "delete", "toggle"):
+        return None, f"unknown op {kind!r}"
+
+    _, columns, toggle_column = BATCH_ENTITIES[entity]
+    if kind == "toggle" and not toggle_column:
+        return None, f"{entity} cannot be toggled"
+
+    clean = {"op": kind, "entity": entity}
+    if kind != "create":
+        try:
+            clean["id"] = int(op.get("id"))
+        except (TypeError, ValueError):
+            return None, "id must be an integer"
+
+    if kind in ("create", "update"):
+        data = op.get("data") or {}
+        if not isinstance(data, dict):
+            return None, "data must be an object"
+        unknown = set(data) - set(columns)
+        if unknown:
+            return None, f"unknown fields: {', '.join(sorted(unknown))}"
+        if kind == "create":
+            missing = [c for c in BATCH_REQUIRED[entity] if c not in data]
+            if missing:
+                return None, f"missing fields: {', '.join(missing)}"
+        elif not data:
+            return None, "update needs at least one field"
+
+        # keep the schema's column order so identical field sets batch together
+        try:
+            clean["values"] = {c: _clean_batch_value(c, data[c]) for c in columns if c in data}
+        except (TypeError, ValueError) as e:
+            return None, str(e)
+
+    return clean, None
+
+FOCUS_FLUSH_MAX = 500           # sessions per buffer flush
+FOCUS_MAX_SECONDS = 4 * 60 * 60
+FOCUS_TREND_DAYS = 14
+FOCUS_TREND_WEEKS = 8
+FOCUS_TASK_CHOICES = 100        # soonest-due open tasks offered on /pomodoro
+
+def validate_focus_session(s):
+    """Normalize one buffered pomodoro session; raises ValueError if invalid."""
+    if not isinstance(s, dict):
+        raise ValueError("session must be an object")
+    client_id = str(s.get("id") or "")
+    if not 0 < len(client_id) <= 64:
+        raise ValueError("id is required (at most 64 characters)")
+    started_at = datetime.fromisoformat(str(s.get("started_at"))).replace(microsecond=0, tzinfo=None)
+    seconds = int(s.get("seconds"))
+    if not 0 < seconds <= FOCUS_MAX_SECONDS:
+        raise ValueError(f"seconds must be between 1 and {FOCUS_MAX_SECONDS}")
+    task_id = s.get("task_id")
+    return {
+        "client_id": client_id,
+        "task_id": int(task_id) if task_id not in (None, "") else None,
+        "category": str(s["category"])[:50] if s.get("category") else None,
+        "started_at": started_at.isoformat(),
+        "seconds": seconds,
+        "completed": 1 if s.get("completed", True) else 0,
+    }
+
 # -------------------- APP SETUP --------------------
 load_dotenv()
-app = Flask(__name__)
-app.secret_key = "smart-assistant-secret-key"
+app = Flask(__name__, static_folder="statics", static_url_path="/statics")
+app.secret_key = os.getenv("SECRET_KEY", "smart-assistant-secret-key")
+app.jinja_env.globals["asset_url"] = asset_url
+app.jinja_env.globals["BASE_CURRENCY"] = BASE_CURRENCY
+app.jinja_env.filters["to_base"] = lambda t: convert_amount(t["amount"], t["currency"], t["date"])
+app.jinja_env.filters["money"] = format_money
+app.after_request(compress_response)
 init_db()
 
+def create_app():
+    """
+    Production entry point (see wsgi.py / gunicorn.conf.py).
+    Every worker must sign sessions with the same key, so it has to come
+    from the environment rather than the development default.
+    """
+    secret_key = os.getenv("SECRET_KEY")
+    if not secret_key:
+        raise RuntimeError("SECRET_KEY must be set when running in production")
+
+    app.secret_key = secret_key
+    app.config.update(
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_SAMESITE="Lax",
+    )
+    return app
+
 OWM_API_KEY = os.getenv("OWM_API_KEY")
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 
-DEFAULT_CATEGORIES = ["General", "Work", "Personal", "Shopping", "Study"]
 PRIORITY_LEVELS = ["High", "Medium", "Low"]
 
+BATCH_MAX_OPS = 1000
+BATCH_REQUIRED = {
+    "task": ("task",),
+    "event": ("title", "date"),
+    "transaction": ("amount", "type", "date"),
+}
+CURRENCY_RE = re.compile(r"[A-Z]{3}")
+
+# -------------------- ASSETS --------------------
+@app.route("/assets/<path:filename>")
+def assets(filename):
+    # fingerprinted by assets.py, so safe to cache forever
+    return send_asset(filename)
+
 # -------------------- AUTH --------------------
 @app.route("/")
 def home():
@@ -101,16 +245,42 @@ def todo_page():
         )
         return redirect("/todo")
 
-    tasks = get_tasks("", "All", "All", "due_date")
-    categories = list(dict.fromkeys(DEFAULT_CATEGORIES + get_categories()))
+    tasks, next_cursor = get_tasks_page()
 
     return render_template(
         "todo.html",
         tasks=tasks,
-        categories=categories,
+        next_cursor=next_cursor,
+        categories=get_categories(include_all=False),
         priorities=PRIORITY_LEVELS
     )
 
+@app.route("/api/tasks")
+def api_tasks():
+    try:
+        limit = min(max(int(request.args.get("limit", TASK_PAGE_SIZE)), 1), 200)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    try:
+        tasks, next_cursor = get_tasks_page(
+            request.args.get("search", "").strip(),
+            request.args.get("category", "All"),
+            request.args.get("priority", "All"),
+            request.args.get("cursor") or None,
+            limit
+        )
+    except ValueError:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    return jsonify({
+        "tasks": [
+            {k: t[k] for k in ("id", "task", "completed", "category", "priority", "due_date")}
+            for t in tasks
+        ],
+        "next_cursor": next_cursor
+    })
+
 @app.route("/toggle/<int:id>/<int:status>")
 def toggle(id, status):
     toggle_task(id, status)
@@ -126,6 +296,143 @@ def clear_done():
     clear_completed()
     return redirect("/todo")
 
+# -------------------- BATCH API --------------------
+@app.route("/api/batch", methods=["POST"])
+def api_batch():
+    uid = session.get("user_id")
+    if not uid:
+        return jsonify({"error": "login required"}), 401
+
+    payload = request.get_json(silent=True) or {}
+    ops = payload.get("operations") if isinstance(payload, dict) else None
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+    if len(ops) > BATCH_MAX_OPS:
+        return jsonify({"error": f"at most {BATCH_MAX_OPS} operations per batch"}), 400
+
+    clean_ops, errors = [], {}
+    for i, op in enumerate(ops):
+        clean, error = validate_batch_op(op)
+        if error:
+            errors[i] = error
+        clean_ops.append(clean)
+
+    if not errors:
+        results, errors = apply_batch(uid, clean_ops)
+        if not errors:
+            return jsonify({"applied": True, "results": results})
+
+    return jsonify({
+        "applied": False,
+        "results": [
+            {"index": i, "ok": False, "error": errors[i]} if i in errors else {"index": i, "ok": True}
+            for i in range(len(ops))
+        ]
+    }), 422
+
+# -------------------- FOCUS SESSIONS --------------------
+@app.route("/api/focus/sessions", methods=["POST"])
+def api_focus_sessions():
+    """
+    Flush of the pomodoro page's local session buffer; safe to re-send.
+    Valid sessions are stored even when others in the batch are rejected;
+    errors maps the rejected ones' indices to the reason.
+    """
+    uid = session.get("user_id")
+    if not uid:
+        return jsonify({"error": "login required"}), 401
+
+    payload = request.get_json(silent=True, force=True) or {}
+    sessions = payload.get("sessions") if isinstance(payload, dict) else None
+    if not isinstance(sessions, list) or not sessions:
+        return jsonify({"error": "sessions must be a non-empty list"}), 400
+    if len(sessions) > FOCUS_FLUSH_MAX:
+        return jsonify({"error": f"at most {FOCUS_FLUSH_MAX} sessions per flush"}), 400
+
+    clean, errors = [], {}
+    for i, s in enumerate(sessions):
+        try:
+            clean.append(validate_focus_session(s))
+        except (KeyError, TypeError, ValueError) as e:
+            errors[i] = str(e)
+    if not clean:
+        return jsonify({"stored": 0, "errors": errors}), 422
+
+    return jsonify({"stored": add_focus_sessions(uid, clean), "received": len(clean), "errors": errors})
+
+# -------------------- DELTA SYNC --------------------
+@app.route("/api/changes")
+def api_changes():
+    uid = session.get("user_id")
+    if not uid:
+        return jsonify({"error": "login required"}), 401
+
+    try:
+        since = max(int(request.args.get("since", 0)), 0)
+        limit = min(max(int(request.args.get("limit", CHANGES_PAGE_SIZE)), 1), 5000)
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+
+    return jsonify(get_changes(uid, since, limit))
+
+@app.route("/api/transactions/archive")
+def api_archived_transactions():
+    """Archived (read-only) transactions of one year, which /api/changes doesn't carry."""
+    uid = session.get("user_id")
+    if not uid:
+        return jsonify({"error": "login required"}), 401
+
+    try:
+        year = int(request.args["year"])
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", CHANGES_PAGE_SIZE)), 1), 5000)
+    except (KeyError, ValueError):
+        return jsonify({"error": "year is required; year, offset and limit must be integers"}), 400
+
+    if year not in [r["year"] for r in get_archived_years()]:
+        return jsonify({"error": f"{year} is not archived"}), 404
+
+    rows = get_transactions(limit + 1, offset, {"date_from": f"{year}-01-01", "date_to": f"{year}-12-31"})
+    return jsonify({
+        "year": year,
+        "transactions": [dict(r) for r in rows[:limit]],
+        "next_offset": offset + limit if len(rows) > limit else None,
+    })
+
+# -------------------- LIVE UPDATES --------------------
+@app.route("/api/stream")
+def api_stream():
+    uid = session.get("user_id")
+    if not uid:
+        return jsonify({"error": "login required"}), 401
+    if not stream_enabled():
+        # 204 tells EventSource to stop reconnecting
+        return Response(status=204)
+
+    sub = hub.subscribe(uid)
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                events, overflowed = sub.drain(HEARTBEAT_INTERVAL)
+                if overflowed:
+                    yield "event: resync\ndata: {}\n\n"
+                for name, version, data in events:
+                    # change events carry their change_log version, usable as
+                    # /api/changes?since=... after a reconnect
+                    event_id = f"id: {version}\n" if version else ""
+                    yield f"{event_id}event: {name}\ndata: {json.dumps(data)}\n\n"
+                if not events and not overflowed:
+                    yield ": ping\n\n"
+        finally:
+            hub.unsubscribe(sub)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 # -------------------- CALENDAR --------------------
 @app.route("/calendar")
 def calendar_page():
@@ -134,10 +441,11 @@ def calendar_page():
         return redirect("/login")
 
     today = date.today().isoformat()
-    return render_template(
+    # the full event list is streamed into the page rather than built in memory
+    return stream_template(
         "calendar.html",
         today=today,
-        events_all=get_events_for_user(uid),
+        events_all=get_events_for_user(uid, stream=True),
         events_today=get_events_for_date(uid, today),
         upcoming=get_upcoming_events(uid)
     )
@@ -164,7 +472,12 @@ def calendar_delete(id):
 # -------------------- POMODORO --------------------
 @app.route("/pomodoro")
 def pomodoro():
-    return render_template("pomodoro.html")
+    return render_template(
+        "pomodoro.html",
+        logged_in="user_id" in session,
+        tasks=get_tasks_page(limit=FOCUS_TASK_CHOICES, pending_only=True)[0],
+        categories=get_categories(include_all=False)
+    )
 
 # -------------------- EXPENSE DASHBOARD --------------------
 @app.route("/expenses")
@@ -200,6 +513,7 @@ def expenses_page():
         recent=recent,
         budget_amount=budget,
         budget_used_pct=budget_used_pct,
+        prev_expense=prev_totals["expense"],
         expense_diff=expense_diff
     )
 
@@ -210,39 +524,82 @@ def transactions_page():
         return redirect("/login")
 
     if request.method == "POST":
+        currency = (request.form.get("currency") or BASE_CURRENCY).upper()
+        if not CURRENCY_RE.fullmatch(currency):
+            abort(400)
         add_transaction(
             float(request.form["amount"]),
             request.form.get("category_id") or None,
             request.form["type"],
             request.form["date"],
             request.form.get("payment_method"),
-            request.form.get("description")
+            request.form.get("description"),
+            currency
         )
         return redirect("/transactions")
 
-    return render_template(
+    # due recurring transactions are inserted by a job worker, not this request
+    enqueue("process_recurring", priority=10)
+
+    return stream_template(
         "transactions.html",
-        transactions=get_transactions(),
-        categories=get_exp_categories()
+        transactions=get_transactions(stream=True),
+        categories=get_exp_categories(),
+        currencies=get_currencies()
     )
 
 @app.route("/transactions/delete/<int:id>")
 def transactions_delete(id):
-    delete_transaction(id)
+    if not delete_transaction(id):
+        # unknown, or archived (read-only)
+        abort(404)
     return redirect("/transactions")
 
+# -------------------- JOBS & REPORTS --------------------
+@app.route("/api/jobs/<int:id>")
+def api_job(id):
+    if "user_id" not in session:
+        return jsonify({"error": "login required"}), 401
+
+    job = get_job(id)
+    if not job:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job_status(job))
+
+@app.route("/api/reports/statement", methods=["POST"])
+def api_statement():
+    if "user_id" not in session:
+        return jsonify({"error": "login required"}), 401
+
+    month = (request.get_json(silent=True) or {}).get("month") or get_current_month()
+    if not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", month):
+        return jsonify({"error": "month must be YYYY-MM"}), 400
+
+    job_id = enqueue("monthly_statement", {"month": month}, priority=5)
+    return jsonify(job_status(get_job(job_id))), 202
+
+@app.route("/reports/statement-<month>.<fmt>")
+def statement_download(month, fmt):
+    if "user_id" not in session:
+        return redirect("/login")
+    if fmt not in ("csv", "html") or not re.fullmatch(r"\d{4}-\d{2}", month):
+        abort(404)
+
+    path = os.path.abspath(statement_path(month, fmt))
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, as_attachment=(fmt == "csv"))
+
 # -------------------- SMART INSIGHTS --------------------
 @app.route("/insights")
 def insights_page():
     if "user_id" not in session:
         return redirect("/login")
 
-    tasks = get_tasks("", "All", "All", "due_date")
-
-    total_tasks = len(tasks)
-
+    total_tasks = 0
     completed_tasks = 0
-    for t in tasks:
+    for t in get_tasks("", "All", "All", "due_date", stream=True):
+        total_tasks += 1
         # SAFELY check available keys
         if "status" in t.keys() and t["status"] == 1:
             completed_tasks += 1
@@ -262,6 +619,22 @@ def insights_page():
 
     expense_diff = totals["expense"] - prev_totals["expense"]
 
+    # Focus: all from the rollup tables, never the raw sessions
+    today = date.today()
+    since_day = (today - timedelta(days=FOCUS_TREND_DAYS - 1)).isoformat()
+    this_week = today - timedelta(days=today.weekday())
+    since_week = (this_week - timedelta(weeks=FOCUS_TREND_WEEKS - 1)).isoformat()
+
+    focus_days = {r.bucket: r.seconds for r in get_focus_trend(session["user_id"], "day", since_day)}
+    done_days = {r.day: r.completed for r in get_completions_by_day(since_day)}
+    days = [(today - timedelta(days=n)).isoformat() for n in range(FOCUS_TREND_DAYS - 1, -1, -1)]
+    focus_weeks = get_focus_trend(session["user_id"], "week", since_week)
+    focus_categories = get_focus_by_category(session["user_id"], since_day)
+
+    focus_minutes = sum(focus_days.values()) // 60
+    completed_recent = sum(done_days.values())
+    week_row = focus_weeks[-1] if focus_weeks and focus_weeks[-1].bucket == this_week.isoformat() else None
+
     return render_template(
         "insights.html",
         total_tasks=total_tasks,
@@ -270,7 +643,20 @@ def insights_page():
         completion_rate=completion_rate,
         expense_diff=expense_diff,
         month=month,
-        prev_month=prev_month
+        prev_month=prev_month,
+        focus_week_minutes=week_row.seconds // 60 if week_row else 0,
+        focus_week_sessions=week_row.sessions if week_row else 0,
+        focus_days=FOCUS_TREND_DAYS,
+        focus_minutes=focus_minutes,
+        minutes_per_completion=round(focus_minutes / completed_recent, 1) if completed_recent else None,
+        focus_chart={
+            "days": days,
+            "minutes": [focus_days.get(d, 0) // 60 for d in days],
+            "completed": [done_days.get(d, 0) for d in days],
+            "weeks": [r.bucket for r in focus_weeks],
+            "week_minutes": [r.seconds // 60 for r in focus_weeks],
+        },
+        focus_categories=focus_categories
     )
 
 # -------------------- RUN --------------------
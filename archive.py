@@ -0,0 +1,105 @@
+# archive.py - move closed years of transactions out of the hot table
+#
+#   python archive.py 2024            archive one year
+#   python archive.py --before 2025   archive every closed year before 2025
+#
+# Each year goes to its own table (transactions_<year>) in
+# archive/transactions_archive.db. Its month totals stay in transaction_rollups
+# so dashboards never need to open the archive, and database.py attaches it
+# read-only whenever a query's date range reaches it.
+import argparse
+import os
+from datetime import datetime
+
+from database import (
+    get_conn, init_db, create_archive_table, tx_archive_table,
+    TX_ARCHIVE_DIR, TX_ARCHIVE_DB, TX_COLUMNS, BASE_AMOUNT, FX_JOIN,
+)
+
+
+def archive_year(year, vacuum=False):
+    """
+    Move every transaction dated in `year` into its archive table and
+    replace them with monthly rollups. Running it again for the same year
+    merges transactions added to that year since. Returns rows moved.
+    """
+    if year >= datetime.now().year:
+        raise ValueError(f"{year} is not closed yet")
+
+    os.makedirs(TX_ARCHIVE_DIR, exist_ok=True)
+    table = f"arc.{tx_archive_table(year)}"
+
+    start, end = f"{year}-01-01", f"{year + 1}-01-01"
+    columns = ", ".join(TX_COLUMNS)
+
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("ATTACH DATABASE ? AS arc", (TX_ARCHIVE_DB,))
+    create_archive_table(cur, year)
+
+    # copy first and commit: the archive is a separate file, so a crash
+    # before the delete below leaves duplicates (ignored on retry), not gaps
+    cur.execute(f"""
+        INSERT OR IGNORE INTO {table} ({columns})
+        SELECT {columns} FROM main.transactions WHERE date >= ? AND date < ?
+    """, (start, end))
+    conn.commit()
+
+    cur.execute("DELETE FROM transaction_rollups WHERE month >= ? AND month < ?", (start[:7], end[:7]))
+    # rollups are kept in the base currency, converted at each day's rate;
+    # rows in a currency with no rate yet are left out of total and counted
+    # in unconverted (re-archive the year once its rates are loaded)
+    cur.execute(f"""
+        INSERT INTO transaction_rollups (month, category_id, type, total, tx_count, unconverted)
+        SELECT month, category_id, type, COALESCE(SUM(amount), 0), COUNT(*), COUNT(*) - COUNT(amount)
+        FROM (
+            SELECT strftime('%Y-%m', t.date) AS month, t.category_id, t.type, {BASE_AMOUNT} AS amount
+            FROM {table} t {FX_JOIN}
+        )
+        GROUP BY 1, 2, 3
+    """)
+    cur.execute(f"SELECT COUNT(*) FROM {table}")
+    row_count = cur.fetchone()[0]
+    cur.execute("""
+        INSERT OR REPLACE INTO transaction_archives (year, path, row_count)
+        VALUES (?, ?, ?)
+    """, (year, TX_ARCHIVE_DB, row_count))
+    # same transaction: the change log must not record these as deletes
+    cur.execute("UPDATE change_log_state SET archiving=1 WHERE id=1")
+    cur.execute("DELETE FROM main.transactions WHERE date >= ? AND date < ?", (start, end))
+    moved = cur.rowcount
+    cur.execute("UPDATE change_log_state SET archiving=0 WHERE id=1")
+    conn.commit()
+    cur.execute("DETACH DATABASE arc")
+
+    if vacuum:
+        # give the freed pages back so the hot file (and its cache) shrinks
+        conn.execute("VACUUM")
+    conn.close()
+    return moved
+
+
+def closed_years_before(year):
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("""
+        SELECT DISTINCT CAST(substr(date, 1, 4) AS INTEGER) AS year
+        FROM transactions WHERE date < ? ORDER BY year
+    """, (f"{year}-01-01",))
+    rows = cur.fetchall(); conn.close()
+    return [r["year"] for r in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive closed years of transactions.")
+    parser.add_argument("year", type=int, nargs="?", help="year to archive")
+    parser.add_argument("--before", type=int, help="archive every year before this one")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the main database afterwards")
+    args = parser.parse_args()
+
+    if args.year is None and args.before is None:
+        parser.error("give a year or --before YEAR")
+
+    init_db()
+    years = [args.year] if args.year is not None else closed_years_before(args.before)
+    for i, y in enumerate(years):
+        moved = archive_year(y, vacuum=args.vacuum and i == len(years) - 1)
+        print(f"{y}: moved {moved} transactions to {TX_ARCHIVE_DB}")
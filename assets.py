@@ -0,0 +1,251 @@
+# assets.py - static asset pipeline and HTTP compression
+#
+#   python assets.py            vendor CDN assets (needs network) and build
+#   python assets.py --offline  build from what is already in statics/
+#
+# The build copies every file under statics/ (vendored ones included) to
+# statics/dist/ under a content-hashed name, next to .gz and .br (if the
+# brotli package is installed) versions, and writes statics/dist/manifest.json.
+# Templates call asset_url("bootstrap.min.css"); /assets/ serves the hashed
+# files with far-future immutable caching and the best precompressed variant.
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+import zlib
+from urllib.request import Request, urlopen
+
+from flask import request, send_file, abort
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "statics")
+VENDOR_DIR = os.path.join(STATIC_DIR, "vendor")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST = os.path.join(DIST_DIR, "manifest.json")
+
+# logical name -> CDN url; also the fallback while nothing has been built
+VENDOR_ASSETS = {
+    "bootstrap.min.css": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css",
+    "chart.umd.min.js": "https://cdn.jsdelivr.net/npm/chart.js@4.3.0/dist/chart.umd.min.js",
+    "fullcalendar.min.js": "https://cdn.jsdelivr.net/npm/fullcalendar@6.1.11/index.global.min.js",
+    "fullcalendar.min.css": "https://cdn.jsdelivr.net/npm/fullcalendar@6.1.11/index.global.min.css",
+    "poppins.css": "https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;600&display=swap",
+}
+
+# Google Fonts picks the font format from the User-Agent; ask for woff2
+FONT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map"}
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# dynamic compression of rendered pages / API responses
+COMPRESS_MIMETYPES = {"text/html", "application/json", "text/css", "application/javascript", "text/plain"}
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+# streamed pages: bytes of HTML between sync flushes (see _gzip_stream)
+STREAM_FLUSH_SIZE = 4096
+
+
+# ---------------- BUILD ----------------
+def _fetch(url):
+    req = Request(url, headers={"User-Agent": FONT_USER_AGENT})
+    with urlopen(req, timeout=30) as res:
+        return res.read()
+
+
+def vendor_assets():
+    """Download VENDOR_ASSETS (and the font files poppins.css points at) into statics/vendor/."""
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    for name, url in VENDOR_ASSETS.items():
+        try:
+            data = _fetch(url)
+        except OSError as e:
+            # asset_url() keeps pointing at the CDN for anything not vendored
+            print(f"skipped {name}: {e}")
+            continue
+        if name.endswith(".css"):
+            # pull remote url(...) references (web fonts) in as local files
+            css = data.decode("utf-8")
+            for remote in sorted(set(re.findall(r"url\((https://[^)]+)\)", css))):
+                local = "fonts/" + os.path.basename(remote.split("?")[0])
+                os.makedirs(os.path.join(VENDOR_DIR, "fonts"), exist_ok=True)
+                with open(os.path.join(VENDOR_DIR, local), "wb") as f:
+                    f.write(_fetch(remote))
+                css = css.replace(remote, local)
+            data = css.encode("utf-8")
+        with open(os.path.join(VENDOR_DIR, name), "wb") as f:
+            f.write(data)
+        print(f"vendored {name} ({len(data)} bytes)")
+
+
+def _hashed_name(rel_path, data):
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def build_assets():
+    """Fingerprint and precompress statics/ into statics/dist/; returns the manifest."""
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+
+    sources = {}
+    for dirpath, dirnames, filenames in os.walk(STATIC_DIR):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != DIST_DIR]
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            rel = os.path.relpath(path, STATIC_DIR).replace(os.sep, "/")
+            # vendored files are addressed by their plain name
+            name = rel[len("vendor/"):] if rel.startswith("vendor/") else rel
+            with open(path, "rb") as f:
+                sources[name] = f.read()
+
+    manifest = {}
+    # fonts and other non-CSS files first, so CSS can point at their hashed names
+    for name in sorted(sources, key=lambda n: n.endswith(".css")):
+        data = sources[name]
+        if name.endswith(".css"):
+            text = data.decode("utf-8")
+            css_dir = os.path.dirname(name)
+            for ref in set(re.findall(r"url\(['\"]?([^'\")]+)['\"]?\)", text)):
+                target = os.path.normpath(os.path.join(css_dir, ref)).replace(os.sep, "/")
+                if target in manifest:
+                    hashed = os.path.relpath(manifest[target], css_dir or ".").replace(os.sep, "/")
+                    text = text.replace(ref, hashed)
+            data = text.encode("utf-8")
+
+        hashed = _hashed_name(name, data)
+        out = os.path.join(DIST_DIR, hashed)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, "wb") as f:
+            f.write(data)
+
+        if os.path.splitext(name)[1] in COMPRESSIBLE:
+            variants = {".gz": gzip.compress(data, 9, mtime=0)}
+            if brotli:
+                variants[".br"] = brotli.compress(data, quality=11)
+            for ext, packed in variants.items():
+                # tiny files can come out larger; serve those as they are
+                if len(packed) < len(data):
+                    with open(out + ext, "wb") as f:
+                        f.write(packed)
+
+        manifest[name] = hashed
+
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def report(manifest):
+    for name, hashed in sorted(manifest.items()):
+        path = os.path.join(DIST_DIR, hashed)
+        sizes = [os.path.getsize(path)]
+        for ext in (".gz", ".br"):
+            sizes.append(os.path.getsize(path + ext) if os.path.exists(path + ext) else None)
+        print(f"{name:28} {sizes[0]:>9}  gz {sizes[1] or '-':>8}  br {sizes[2] or '-':>8}")
+
+
+# ---------------- SERVING ----------------
+_manifest = None
+
+
+def load_manifest():
+    global _manifest
+    try:
+        with open(MANIFEST) as f:
+            _manifest = json.load(f)
+    except FileNotFoundError:
+        _manifest = {}
+    return _manifest
+
+
+def asset_url(name):
+    """URL of a static asset: its fingerprinted copy once built, else the CDN / plain file."""
+    if _manifest is None:
+        load_manifest()
+    if name in _manifest:
+        return f"/assets/{_manifest[name]}"
+    return VENDOR_ASSETS.get(name, f"/statics/{name}")
+
+
+def send_asset(filename):
+    """Serve a file from statics/dist/, preferring a precompressed variant."""
+    path = os.path.abspath(os.path.join(DIST_DIR, filename))
+    if not path.startswith(DIST_DIR + os.sep) or not os.path.isfile(path):
+        abort(404)
+
+    accepted = request.headers.get("Accept-Encoding", "")
+    encoding = None
+    for enc, ext in (("br", ".br"), ("gzip", ".gz")):
+        if enc in accepted and os.path.exists(path + ext):
+            encoding, path = enc, path + ext
+            break
+
+    response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], max_age=31536000, etag=True)
+    response.headers["Cache-Control"] = ASSET_CACHE_CONTROL
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def _gzip_stream(chunks):
+    # compressobj holds output back until its window fills (~100 KB of HTML),
+    # which would undo the streaming; sync-flush whenever STREAM_FLUSH_SIZE of
+    # input has gone in since the last flush. Jinja yields many tiny pieces,
+    # and flushing after each would cost most of the compression.
+    packer = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = 0
+    for chunk in chunks:
+        chunk = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        data = packer.compress(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_SIZE:
+            data += packer.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield packer.flush()
+
+
+def compress_response(response):
+    """after_request hook: gzip sizeable HTML/JSON responses on the fly."""
+    if (
+        response.status_code < 200 or response.status_code >= 300
+        or response.direct_passthrough          # files (precompressed already)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESS_MIMETYPES   # e.g. the SSE stream
+        or "gzip" not in request.headers.get("Accept-Encoding", "")
+    ):
+        return response
+
+    if response.is_streamed:
+        # streamed templates: compress chunk by chunk as they are rendered
+        response.response = _gzip_stream(response.response)
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(data, COMPRESS_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+if __name__ == "__main__":
+    if "--offline" not in sys.argv:
+        vendor_assets()
+    report(build_assets())
@@ -0,0 +1,136 @@
+# benchmarks/cache_load.py - request throughput against worker count
+#
+#   python benchmarks/cache_load.py --username demo --pin 1234 --workers 1,2,4,8
+#
+# For each worker count N, starts `gunicorn -c gunicorn.conf.py wsgi:app` (N workers)
+# on --port (job workers off, so only web requests compete for the CPU), logs
+# in, and has --concurrency clients request --paths for --duration seconds.
+# Reports requests/second per worker count and the speed-up over the first
+# count. The pages default to the ones built from the shared cache (see
+# cached() in database.py); every worker after the first reads entries the
+# others stored, so throughput should grow with workers up to the core count.
+#
+# --url skips starting servers and measures one already-running deployment.
+# Clients are separate processes (not threads) so the load generator itself
+# isn't capped at one core; run it on another machine for the cleanest numbers.
+# Only the standard library is needed on the client side.
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+from http.cookiejar import CookieJar
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener, urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def login(url, username, pin):
+    jar = CookieJar()
+    opener = build_opener(HTTPCookieProcessor(jar))
+    opener.open(url + "/login", urlencode({"username": username, "pin": pin}).encode())
+    cookies = "; ".join(f"{c.name}={c.value}" for c in jar)
+    if "session=" not in cookies:
+        raise SystemExit("login failed")
+    return cookies
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urlopen(url + "/login", timeout=1).read()
+            return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    raise SystemExit(f"server at {url} did not come up")
+
+
+def start_gunicorn(workers, port):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}",
+               JOB_WORKERS="0", LIVE_STREAM="0")
+    env.setdefault("SECRET_KEY", "benchmark")
+    return subprocess.Popen(
+        [shutil.which("gunicorn"), "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def client(url, cookies, paths, stop, done, failed):
+    ok = errors = 0
+    i = 0
+    while not stop.is_set():
+        req = Request(url + paths[i % len(paths)], headers={"Cookie": cookies})
+        try:
+            with urlopen(req, timeout=30) as res:
+                res.read()
+            ok += 1
+        except (URLError, OSError):
+            errors += 1
+        i += 1
+    with done.get_lock():
+        done.value += ok
+        failed.value += errors
+
+
+def measure(url, args):
+    cookies = login(url, args.username, args.pin)
+    # one pass first, so every page's cache entries exist
+    for path in args.paths:
+        urlopen(Request(url + path, headers={"Cookie": cookies})).read()
+
+    stop = multiprocessing.Event()
+    done, failed = multiprocessing.Value("i", 0), multiprocessing.Value("i", 0)
+    clients = [
+        multiprocessing.Process(target=client, args=(url, cookies, args.paths, stop, done, failed))
+        for _ in range(args.concurrency)
+    ]
+    for c in clients:
+        c.start()
+    time.sleep(args.duration)
+    stop.set()
+    for c in clients:
+        c.join()
+    return done.value / args.duration, failed.value
+
+
+def main(args):
+    if args.url:
+        rps, errors = measure(args.url, args)
+        print(f"{args.url}: {rps:.0f} req/s ({errors} errors)")
+        return
+
+    if not shutil.which("gunicorn"):
+        raise SystemExit("gunicorn not found: pip install gunicorn, or pass --url")
+
+    url = f"http://127.0.0.1:{args.port}"
+    baseline = None
+    print(f"cores: {os.cpu_count()}, clients: {args.concurrency}, pages: {' '.join(args.paths)}")
+    for workers in args.workers:
+        server = start_gunicorn(workers, args.port)
+        try:
+            wait_until_up(url)
+            rps, errors = measure(url, args)
+        finally:
+            server.terminate()
+            server.wait()
+        baseline = baseline or rps
+        print(f"{workers:>3} workers: {rps:8.0f} req/s  x{rps / baseline:.2f}  ({errors} errors)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput vs. gunicorn worker count.")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--pin", required=True)
+    parser.add_argument("--workers", default=f"1,2,4,{os.cpu_count()}",
+                        type=lambda s: [int(n) for n in s.split(",")])
+    parser.add_argument("--paths", default="/expenses,/insights,/dashboard",
+                        type=lambda s: s.split(","))
+    parser.add_argument("--concurrency", type=int, default=16, help="client processes")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per worker count")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--url", help="measure this running server instead of starting gunicorn")
+    main(parser.parse_args())
@@ -0,0 +1,129 @@
+# benchmarks/focus_sessions.py - focus session writes and insights reads at scale
+#
+#   python benchmarks/focus_sessions.py --sessions 2000000 --users 50
+#
+# In a scratch database (temporary directory, never assistant.db): writes
+# --sessions pomodoro sessions spread over --days days through
+# add_focus_sessions() in flush-sized batches, the way /api/focus/sessions
+# does, so the rollup triggers run for every row. Reports write throughput as
+# the table grows, then times the insights page's focus queries for one user
+# (served from focus_rollups) next to the same numbers computed by scanning
+# focus_sessions, which is what the rollups spare the page.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BATCH = 500                 # FOCUS_FLUSH_MAX in app.py
+CATEGORIES = ["Work", "Study", "Personal", "Health", "General"]
+
+
+def batches(args, rnd):
+    start = datetime.combine(date.today() - timedelta(days=args.days), datetime.min.time())
+    n = 0
+    while n < args.sessions:
+        size = min(BATCH, args.sessions - n)
+        user = rnd.randint(1, args.users)
+        batch = []
+        for i in range(size):
+            started = start + timedelta(seconds=rnd.randrange(args.days * 86400))
+            task = rnd.randint(1, args.tasks) if rnd.random() < 0.6 else None
+            batch.append({
+                "client_id": f"{n + i:x}",
+                "task_id": task,
+                "category": None if task else rnd.choice(CATEGORIES),
+                "started_at": started.isoformat(),
+                "seconds": rnd.choice([1500, 1500, 1500, 900, 600]),
+                "completed": 1,
+            })
+        yield user, batch
+        n += size
+
+
+def timed(fn, repeat=5):
+    """Best of `repeat` runs, in milliseconds, and the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main(args):
+    os.chdir(tempfile.mkdtemp(prefix="focus-bench-"))
+    sys.path.insert(0, ROOT)
+    import database
+
+    database.init_db()
+    rnd = random.Random(7)
+
+    conn = database.get_conn()
+    conn.executemany(
+        "INSERT INTO tasks (task, category, priority) VALUES (?, ?, 'Medium')",
+        ((f"task {i}", rnd.choice(CATEGORIES)) for i in range(args.tasks)),
+    )
+    conn.execute("UPDATE tasks SET completed=1 WHERE id % 3 = 0")
+    conn.commit()
+    conn.close()
+
+    print(f"writing {args.sessions:,} sessions in batches of {BATCH} ...")
+    written = 0
+    start = lap = time.perf_counter()
+    step = max(args.sessions // 10, BATCH)
+    for user, batch in batches(args, rnd):
+        written += database.add_focus_sessions(user, batch)
+        if written % step < BATCH or written == args.sessions:
+            now = time.perf_counter()
+            print(f"  {written:>12,} stored  {step / (now - lap):>10,.0f} sessions/s recently")
+            lap = now
+    total = time.perf_counter() - start
+    print(f"  total {total:.1f}s, {args.sessions / total:,.0f} sessions/s")
+
+    conn = database.get_conn()
+    rollups = conn.execute("SELECT COUNT(*) FROM focus_rollups").fetchone()[0]
+    print(f"focus_rollups: {rollups:,} rows for {args.sessions:,} sessions")
+
+    user = 1
+    today = date.today()
+    since_day = (today - timedelta(days=13)).isoformat()
+    since_week = (today - timedelta(weeks=7)).isoformat()
+
+    reads = [
+        ("daily trend", lambda: database.get_focus_trend(user, "day", since_day),
+         lambda: conn.execute("""
+            SELECT date(started_at) AS day, COUNT(*), SUM(seconds) FROM focus_sessions
+            WHERE user_id=? AND started_at >= ? GROUP BY day ORDER BY day
+         """, (user, since_day)).fetchall()),
+        ("weekly trend", lambda: database.get_focus_trend(user, "week", since_week),
+         lambda: conn.execute("""
+            SELECT date(started_at, 'weekday 0', '-6 days') AS week, COUNT(*), SUM(seconds)
+            FROM focus_sessions WHERE user_id=? AND started_at >= ? GROUP BY week ORDER BY week
+         """, (user, since_week)).fetchall()),
+        ("by category", lambda: database.get_focus_by_category(user, since_day),
+         lambda: conn.execute("""
+            SELECT category, COUNT(*), SUM(seconds) FROM focus_sessions
+            WHERE user_id=? AND started_at >= ? GROUP BY category
+         """, (user, since_day)).fetchall()),
+    ]
+    print(f"insights queries for one user ({args.days} days of data):")
+    print(f"  {'':<14}{'rollups':>10}{'raw scan':>12}")
+    for name, rolled, raw in reads:
+        fast, _ = timed(rolled)
+        slow, _ = timed(raw, repeat=2)
+        print(f"  {name:<14}{fast:>8.2f}ms{slow:>10.1f}ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Focus session store benchmark.")
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365)
+    main(parser.parse_args())
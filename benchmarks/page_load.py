@@ -0,0 +1,179 @@
+# benchmarks/page_load.py - bytes on the wire and load time of the main pages
+#
+#   python assets.py                    # build statics/dist first
+#   python benchmarks/page_load.py --username demo --pin 1234 --rtt 50 --mbps 10
+#
+# Against a running server: for each page, fetches the HTML and every
+# stylesheet, script, image and font it (and its CSS) references, three ways:
+#
+#   identity   no Accept-Encoding, empty cache
+#   cold       Accept-Encoding: gzip, br, empty cache
+#   warm       compressed, with the cache the cold load left behind: assets
+#              marked immutable / max-age are not requested again, others are
+#              revalidated with If-None-Match / If-Modified-Since
+#
+# and reports the bytes received (headers + body, as sent) and the load time.
+# Assets load over --connections parallel connections after the page, like a
+# browser. On localhost the network is nearly free, so --rtt (ms added per
+# request) and --mbps (link speed) model a real one; the times printed are the
+# measured ones plus that model. Run it against an older checkout for the
+# before numbers (CDN assets need network access there).
+import argparse
+import gzip
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin, urlsplit
+from urllib.request import HTTPCookieProcessor, Request, build_opener, urlopen
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PAGES = ["/dashboard", "/todo", "/calendar", "/transactions", "/expenses", "/insights"]
+
+HTML_REFS = re.compile(r"""<(?:link[^>]+href|script[^>]+src|img[^>]+src)=["']([^"']+)["']""", re.I)
+CSS_REFS = re.compile(r"""url\(["']?([^"')]+)["']?\)""")
+
+
+def login(url, username, pin):
+    jar = CookieJar()
+    opener = build_opener(HTTPCookieProcessor(jar))
+    opener.open(url + "/login", urlencode({"username": username, "pin": pin}).encode())
+    cookies = "; ".join(f"{c.name}={c.value}" for c in jar)
+    if "session=" not in cookies:
+        raise SystemExit("login failed")
+    return cookies
+
+
+class Fetch:
+    """One response: status, bytes received, decoded body and cache headers."""
+
+    def __init__(self, url, headers, args):
+        self.url = url
+        start = time.perf_counter()
+        try:
+            res = urlopen(Request(url, headers=headers), timeout=30)
+        except HTTPError as e:
+            res = e
+        except URLError:
+            self.status, self.size, self.text, self.headers = None, 0, "", {}
+            self.elapsed = time.perf_counter() - start + args.rtt / 1000
+            return
+        with res:
+            body = res.read()
+            self.status = res.code
+            self.headers = {k.lower(): v for k, v in res.headers.items()}
+        self.size = len(str(res.headers)) + len(body) + 20   # + status line
+        # measured time plus the modelled network: one round trip and the transfer
+        self.elapsed = (time.perf_counter() - start + args.rtt / 1000
+                        + self.size * 8 / (args.mbps * 1_000_000))
+        self.text = self._decode(body)
+
+    def _decode(self, body):
+        encoding = self.headers.get("content-encoding")
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "br":
+            if brotli is None:
+                return ""
+            body = brotli.decompress(body)
+        kind = self.headers.get("content-type", "")
+        return body.decode("utf-8", "replace") if "html" in kind or "css" in kind else ""
+
+    @property
+    def cacheable(self):
+        cc = self.headers.get("cache-control", "")
+        return "immutable" in cc or re.search(r"max-age=[1-9]", cc) is not None
+
+    def references(self):
+        """Absolute URLs this page or stylesheet pulls in."""
+        if self.status != 200:
+            return []
+        pattern = CSS_REFS if "css" in self.headers.get("content-type", "") else HTML_REFS
+        return [urljoin(self.url, ref) for ref in pattern.findall(self.text) if not ref.startswith("data:")]
+
+
+def load(page_url, cookies, args, accept_encoding, cache=None):
+    """
+    Load a page and, wave by wave, everything it references. Returns
+    (bytes, seconds, requests, cache) where cache maps url -> Fetch.
+    """
+    cache = cache or {}
+    host = urlsplit(page_url).netloc
+
+    def fetch(url):
+        headers = {"Cookie": cookies} if urlsplit(url).netloc == host else {}
+        if accept_encoding:
+            headers["Accept-Encoding"] = accept_encoding
+        old = cache.get(url)
+        if old and "etag" in old.headers:
+            headers["If-None-Match"] = old.headers["etag"]
+        if old and "last-modified" in old.headers:
+            headers["If-Modified-Since"] = old.headers["last-modified"]
+        return Fetch(url, headers, args)
+
+    page = fetch(page_url)
+    total_bytes, total_time, requests = page.size, page.elapsed, 1
+    kept = {}
+    seen = set()
+    pending = page.references()
+    with ThreadPoolExecutor(args.connections) as pool:
+        while pending:
+            seen.update(pending)
+            hits = [u for u in pending if u in cache and cache[u].cacheable]
+            wave = [u for u in pending if u not in hits]
+            fetched = list(pool.map(fetch, wave))
+
+            # the wave lasts as long as its busiest connection
+            lanes = [0.0] * args.connections
+            for f in sorted(fetched, key=lambda f: -f.elapsed):
+                lanes[lanes.index(min(lanes))] += f.elapsed
+            total_time += max(lanes)
+            total_bytes += sum(f.size for f in fetched)
+            requests += len(fetched)
+
+            resolved = [cache[u] for u in hits]
+            resolved += [cache.get(f.url, f) if f.status == 304 else f for f in fetched]
+            kept.update((f.url, f) for f in resolved)
+            pending = [ref for f in resolved for ref in f.references() if ref not in seen]
+            pending = list(dict.fromkeys(pending))
+    return total_bytes, total_time, requests, kept
+
+
+def main(args):
+    cookies = login(args.url, args.username, args.pin)
+    print(f"rtt {args.rtt:.0f} ms, {args.mbps:g} Mbit/s, {args.connections} connections")
+    print(f"{'page':<14}{'identity':>26}{'cold (gzip/br)':>26}{'warm cache':>26}")
+    totals = [[0, 0.0] for _ in range(3)]
+    for path in args.pages:
+        url = args.url + path
+        runs = [load(url, cookies, args, None)]
+        runs.append(load(url, cookies, args, "gzip, br"))
+        runs.append(load(url, cookies, args, "gzip, br", cache=runs[1][3]))
+        cells = []
+        for i, (size, seconds, requests, _) in enumerate(runs):
+            totals[i][0] += size
+            totals[i][1] += seconds
+            cells.append(f"{size / 1024:8.1f} KB {seconds * 1000:6.0f} ms {requests:>2}r")
+        print(f"{path:<14}" + "".join(f"{c:>26}" for c in cells))
+    print(f"{'total':<14}" + "".join(f"{s / 1024:8.1f} KB {t * 1000:6.0f} ms    ".rjust(26) for s, t in totals))
+    (b0, t0), (b1, t1), (b2, t2) = totals
+    if b0 and t0:
+        print(f"cold vs identity: {100 - b1 * 100 / b0:.0f}% fewer bytes, {100 - t1 * 100 / t0:.0f}% less time; "
+              f"warm vs identity: {100 - b2 * 100 / b0:.0f}% fewer bytes, {100 - t2 * 100 / t0:.0f}% less time")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Page weight and load time, compressed vs not, cold vs warm.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--pin", required=True)
+    parser.add_argument("--pages", default=",".join(PAGES), type=lambda s: s.split(","))
+    parser.add_argument("--rtt", type=float, default=50, help="round trip added per request, ms")
+    parser.add_argument("--mbps", type=float, default=10, help="modelled link speed, Mbit/s")
+    parser.add_argument("--connections", type=int, default=6, help="parallel asset connections")
+    main(parser.parse_args())
@@ -0,0 +1,109 @@
+# benchmarks/page_memory.py - peak Python memory per request on the big pages
+#
+#   python benchmarks/page_memory.py                       # this checkout
+#   git worktree add /tmp/before <older commit>
+#   python benchmarks/page_memory.py --app-dir /tmp/before  # same data, old code
+#
+# Seeds a scratch database (in a temporary directory, never assistant.db) with
+# --rows transactions, events and tasks, then requests the listing pages
+# through the app's WSGI interface, reading the body chunk by chunk as a
+# server would, and reports tracemalloc's peak for each request. Running it
+# against two checkouts compares materialized sqlite3.Row lists rendered in
+# one piece with Record rows streamed into the template.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = ["/transactions", "/calendar", "/todo"]
+
+
+def seed(conn, rows, user_id):
+    """Insert rows of each kind using only columns every schema version has."""
+    rnd = random.Random(42)
+    day = lambda i: f"{2020 + i % 6}-{i % 12 + 1:02d}-{i % 28 + 1:02d}"
+    cur = conn.cursor()
+    cur.executemany(
+        "INSERT INTO transactions (amount, type, date, payment_method, description) VALUES (?, ?, ?, ?, ?)",
+        ((round(rnd.uniform(10, 5000), 2), rnd.choice(["income", "expense"]), day(i), "UPI",
+          f"transaction {i}") for i in range(rows)),
+    )
+    cur.executemany(
+        "INSERT INTO events (user_id, title, date, time, category, notes) VALUES (?, ?, ?, ?, ?, ?)",
+        ((user_id, f"event {i}", day(i), "10:00", "Personal", "notes " * 5) for i in range(rows)),
+    )
+    cur.executemany(
+        "INSERT INTO tasks (task, category, priority, due_date) VALUES (?, ?, ?, ?)",
+        ((f"task {i}", rnd.choice(["Work", "Personal"]), rnd.choice(["High", "Medium", "Low"]),
+          day(i)) for i in range(rows)),
+    )
+    conn.commit()
+
+
+def request(app, path, cookie):
+    """Run one GET through the WSGI app; returns (status, body bytes)."""
+    from werkzeug.test import EnvironBuilder
+
+    environ = EnvironBuilder(path=path, headers={"Cookie": cookie}).get_environ()
+    status = []
+    body = 0
+    result = app.wsgi_app(environ, lambda s, h, exc_info=None: status.append(s))
+    try:
+        for chunk in result:
+            body += len(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return status[0], body
+
+
+def main(args):
+    app_dir = os.path.abspath(args.app_dir)
+    workdir = tempfile.mkdtemp(prefix="page-memory-")
+    os.chdir(workdir)                   # the app keeps assistant.db in the cwd
+    sys.path.insert(0, app_dir)
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    from app import app                 # runs init_db() in workdir
+    import database
+
+    conn = database.get_conn()
+    conn.execute("INSERT INTO users (username, pin) VALUES ('bench', '0000')")
+    user_id = conn.execute("SELECT id FROM users WHERE username='bench'").fetchone()[0]
+    start = time.perf_counter()
+    seed(conn, args.rows, user_id)
+    conn.close()
+    print(f"{app_dir}: {args.rows} rows of each kind seeded in {time.perf_counter() - start:.1f}s")
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = "bench"
+    cookie = client.get_cookie("session")
+    cookie = f"session={cookie.value}" if cookie else ""
+
+    tracemalloc.start()
+    for path in args.pages:
+        request(app, path, cookie)      # warm caches and compiled templates
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        status, size = request(app, path, cookie)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - base
+        print(f"{path:<14} {status:<8} {size / 1024:8.0f} KB body  "
+              f"peak {peak / 1024:8.0f} KB  {elapsed * 1000:7.0f} ms")
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request peak memory (tracemalloc).")
+    parser.add_argument("--app-dir", default=ROOT, help="checkout whose app.py to measure")
+    parser.add_argument("--rows", type=int, default=20000, help="transactions, events and tasks each")
+    parser.add_argument("--pages", default=",".join(PAGES), type=lambda s: s.split(","))
+    main(parser.parse_args())
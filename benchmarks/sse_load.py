@@ -0,0 +1,142 @@
+# benchmarks/sse_load.py - hold many idle /api/stream connections open
+#
+#   python benchmarks/sse_load.py --url http://127.0.0.1:8000 \
+#       --username demo --pin 1234 --connections 2000 --hold 60
+#
+# Against a running deployment (e.g. gunicorn -c gunicorn.conf.py wsgi:app):
+# logs in once, opens --connections event streams with that session, keeps
+# them idle for --hold seconds while timing ordinary page requests, and
+# reports how many streams were accepted, how many heartbeats arrived and the
+# page latency seen meanwhile. With --pid (the gunicorn master) it also reports
+# the total RSS of the server processes before and after opening the streams.
+# Only the standard library is used; raise `ulimit -n` for large counts.
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, build_opener
+
+
+def login(url, username, pin):
+    jar = CookieJar()
+    opener = build_opener(HTTPCookieProcessor(jar))
+    opener.open(url + "/login", urlencode({"username": username, "pin": pin}).encode())
+    cookies = "; ".join(f"{c.name}={c.value}" for c in jar)
+    if "session=" not in cookies:
+        raise SystemExit("login failed")
+    return cookies
+
+
+def server_rss(pid):
+    """RSS in MB of pid and its direct children (Linux /proc)."""
+    pids = [pid]
+    children = f"/proc/{pid}/task/{pid}/children"
+    if os.path.exists(children):
+        with open(children) as f:
+            pids += [int(p) for p in f.read().split()]
+    total = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return total / 1024
+
+
+async def open_stream(host, port, cookies, stats, stop):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats["refused"] += 1
+        return
+    writer.write((
+        f"GET /api/stream HTTP/1.1\r\nHost: {host}\r\nCookie: {cookies}\r\n"
+        "Accept: text/event-stream\r\n\r\n"
+    ).encode())
+    try:
+        status = await asyncio.wait_for(reader.readline(), 30)
+        if b" 200 " not in status:
+            stats["rejected"] += 1
+            return
+        stats["open"] += 1
+        while not stop.is_set():
+            line = await asyncio.wait_for(reader.readline(), 60)
+            if not line:
+                stats["dropped"] += 1
+                return
+            if line.startswith(b": ping"):
+                stats["heartbeats"] += 1
+    except (asyncio.TimeoutError, OSError):
+        stats["dropped"] += 1
+    finally:
+        writer.close()
+
+
+async def page_latency(host, port, cookies, path, stop, samples):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookies}\r\nConnection: close\r\n\r\n".encode())
+            await asyncio.wait_for(reader.read(), 30)
+            writer.close()
+            samples.append(time.perf_counter() - start)
+        except (asyncio.TimeoutError, OSError):
+            samples.append(float("inf"))
+        await asyncio.sleep(0.5)
+
+
+async def main(args):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+    cookies = login(args.url, args.username, args.pin)
+
+    rss_before = server_rss(args.pid) if args.pid else None
+    stats = dict.fromkeys(("open", "rejected", "refused", "dropped", "heartbeats"), 0)
+    stop = asyncio.Event()
+    streams = []
+    for i in range(args.connections):
+        streams.append(asyncio.create_task(open_stream(host, port, cookies, stats, stop)))
+        if i % 100 == 99:
+            await asyncio.sleep(0.1)    # don't overrun the listen backlog
+
+    samples = []
+    prober = asyncio.create_task(page_latency(host, port, cookies, args.page, stop, samples))
+    await asyncio.sleep(args.hold)
+    rss_after = server_rss(args.pid) if args.pid else None
+    stop.set()
+    await prober
+    for t in streams:
+        t.cancel()
+    await asyncio.gather(*streams, return_exceptions=True)
+
+    print(f"streams: {stats['open']} open, {stats['rejected']} rejected, "
+          f"{stats['refused']} refused, {stats['dropped']} dropped, {stats['heartbeats']} heartbeats")
+    ok = [s for s in samples if s != float("inf")]
+    if ok:
+        ok.sort()
+        print(f"{args.page} while held: {len(ok)}/{len(samples)} ok, "
+              f"median {statistics.median(ok) * 1000:.1f} ms, max {ok[-1] * 1000:.1f} ms")
+    else:
+        print(f"{args.page} while held: no successful requests")
+    if rss_before is not None:
+        per_stream = (rss_after - rss_before) * 1024 / max(stats["open"], 1)
+        print(f"server RSS: {rss_before:.1f} MB -> {rss_after:.1f} MB (~{per_stream:.1f} KB per stream)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Idle SSE connection load test.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--pin", required=True)
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--hold", type=float, default=30, help="seconds to keep the streams open")
+    parser.add_argument("--page", default="/dashboard", help="page timed while the streams are open")
+    parser.add_argument("--pid", type=int, help="gunicorn master pid, for server memory")
+    asyncio.run(main(parser.parse_args()))
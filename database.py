@@ -1,25 +1,150 @@
 # database.py (FINAL FULL WORKING VERSION)
+import os
+import re
 import sqlite3
+import json
+from functools import wraps, lru_cache
+from itertools import groupby
+from operator import itemgetter
 from typing import List, Optional, Any
 from datetime import datetime
 
 from datetime import datetime, timedelta
 import calendar
+import time
 
 DB = "assistant.db"
 
+# Dashboards and totals are reported in this currency; other currencies are
+# converted through fx_rates (rate = BASE_CURRENCY per 1 unit, per day).
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", "INR").upper()
+if not re.fullmatch(r"[A-Z]{3}", BASE_CURRENCY):
+    raise ValueError(f"BASE_CURRENCY must be a 3-letter ISO code, got {BASE_CURRENCY!r}")
+# seconds a memoized exchange rate is used before it is read again (see get_fx_rate)
+FX_RATE_TTL = 60
+
+DEFAULT_TASK_CATEGORIES = ["General", "Work", "Personal", "Shopping", "Study"]
+
+# Sort key for task listings: dated tasks first, undated last. Used verbatim in
+# the expression indexes so the keyset queries below can walk them in order.
+TASK_SORT_KEY = "IFNULL(due_date, '9999-12-31')"
+TASK_PAGE_SIZE = 50
+
+# Command history retention: rows past the TTL or beyond the per-user cap are
+# moved by prune_history() into monthly tables of an archive database.
+HISTORY_ARCHIVE_DB = "history_archive.db"
+HISTORY_MAX_PER_USER = 1000
+HISTORY_TTL_DAYS = 90
+HISTORY_PRUNE_BATCH = 5000
+
+# Closed years of transactions can be moved into an archive database, one
+# table per year (see archive.py). Reads are routed to the hot table and/or the
+# archive by date range; month aggregates of archived years come from
+# transaction_rollups. A single file keeps every read to one ATTACH (SQLite
+# allows at most 10 per connection).
+TX_ARCHIVE_DIR = "archive"
+TX_ARCHIVE_DB = os.path.join(TX_ARCHIVE_DIR, "transactions_archive.db")
+TX_COLUMNS = ("id", "amount", "currency", "category_id", "type", "date", "payment_method", "description", "created_at")
+
+# table -> shared cache namespace whose generation it bumps on every write
+CACHE_NAMESPACES = {
+    "tasks": "tasks",
+    "transactions": "transactions",
+    "exp_categories": "transactions",
+    "fx_rates": "transactions",
+    # rebuilt by archive.py (e.g. after rate corrections) without touching
+    # any hot row, and read by the month totals
+    "transaction_rollups": "transactions",
+}
+
+# Tables whose row changes are recorded in change_log for delta sync
+# (/api/changes). Deletes are kept as tombstones for CHANGE_LOG_TOMBSTONE_DAYS.
+CHANGE_LOG_TABLES = ("tasks", "events", "transactions", "budgets", "savings_goals")
+CHANGE_LOG_TOMBSTONE_DAYS = 30
+CHANGES_PAGE_SIZE = 500
+
+# Rows fetched per round trip when a listing is streamed (stream=True)
+STREAM_CHUNK = 200
+
 # ---------------- CONNECTION ----------------
 def get_conn():
-    conn = sqlite3.connect(DB)
+    # uri=True so archives can be ATTACHed read-only via file:...?mode=ro
+    conn = sqlite3.connect(DB, uri=True)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+# ---------------- RECORDS ----------------
+# Listings return Records instead of sqlite3.Row: a plain tuple subclass per
+# column shape, with no per-row dict or wrapper object. Fields read like a Row
+# (r["name"], r[0], r.keys(), dict(r)) and like attributes (r.name), so
+# templates and callers work unchanged.
+class Record(tuple):
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return list(self._fields)
+
+    def __repr__(self):
+        return "Record(" + ", ".join(f"{f}={v!r}" for f, v in zip(self._fields, self)) + ")"
+
+
+@lru_cache(maxsize=256)
+def record_type(fields):
+    """Record subclass for one column shape (tuple of column names)."""
+    namespace = {"__slots__": (), "_fields": fields, "_index": {f: i for i, f in enumerate(fields)}}
+    for i, f in enumerate(fields):
+        if f.isidentifier() and not f.startswith("_") and f != "keys":
+            namespace[f] = property(itemgetter(i))
+    return type("Record", (Record,), namespace)
+
+
+def record_factory(cursor, row):
+    return record_type(tuple(d[0] for d in cursor.description))(row)
+
+
+def _stream_rows(conn, cur):
+    try:
+        while True:
+            rows = cur.fetchmany(STREAM_CHUNK)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+def fetch_records(conn, query, params=(), stream=False):
+    """
+    Run a listing query on conn and return its rows as Records. With
+    stream=True, return a lazy iterator instead; it closes conn once it is
+    exhausted (or garbage collected), so iterate it fully, e.g. in a
+    streamed template.
+    """
+    cur = conn.cursor()
+    cur.row_factory = record_factory
+    cur.execute(query, params)
+    if stream:
+        return _stream_rows(conn, cur)
+    rows = cur.fetchall(); conn.close()
+    return rows
+
+
 # ---------------- INITIALIZE DB ----------------
 def init_db():
     conn = get_conn()
     cur = conn.cursor()
 
+    # WAL lets worker processes read while another one writes
+    cur.execute("PRAGMA journal_mode=WAL")
+
     # Users
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users (
@@ -111,10 +236,11 @@ def init_db():
 
 
     # Transactions
-    cur.execute("""
+    cur.execute(f"""
     CREATE TABLE IF NOT EXISTS transactions (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         amount REAL NOT NULL,
+        currency TEXT NOT NULL DEFAULT '{BASE_CURRENCY}',
         category_id INTEGER,
         type TEXT NOT NULL,
         date TEXT NOT NULL,
@@ -125,6 +251,21 @@ def init_db():
     )
     """)
 
+    # databases from before multi-currency: everything was in the base currency
+    cur.execute("PRAGMA table_info(transactions)")
+    if "currency" not in [c["name"] for c in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE transactions ADD COLUMN currency TEXT NOT NULL DEFAULT '{BASE_CURRENCY}'")
+
+    # Daily FX rates (loaded from a file by fx.py, never fetched)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS fx_rates (
+        currency TEXT NOT NULL,
+        date TEXT NOT NULL,          -- YYYY-MM-DD
+        rate REAL NOT NULL,          -- BASE_CURRENCY per 1 unit of currency
+        PRIMARY KEY (currency, date)
+    ) WITHOUT ROWID
+    """)
+
     # Budgets
     cur.execute("""
     CREATE TABLE IF NOT EXISTS budgets (
@@ -139,9 +280,410 @@ def init_db():
     for cat in default_categories:
         cur.execute("INSERT OR IGNORE INTO exp_categories (name) VALUES (?)", (cat,))
 
+    # Task categories (dimension table, counts kept in sync by triggers)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS task_categories (
+        name TEXT PRIMARY KEY,
+        task_count INTEGER NOT NULL DEFAULT 0,
+        is_default INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+    cur.execute("SELECT COUNT(*) FROM task_categories")
+    if cur.fetchone()[0] == 0:
+        # first run (or upgrade): backfill counts from existing tasks
+        for cat in DEFAULT_TASK_CATEGORIES:
+            cur.execute("INSERT INTO task_categories (name, is_default) VALUES (?, 1)", (cat,))
+        cur.execute("""
+            INSERT INTO task_categories (name, task_count)
+            SELECT category, COUNT(*) FROM tasks WHERE category IS NOT NULL GROUP BY category
+            ON CONFLICT(name) DO UPDATE SET task_count = excluded.task_count
+        """)
+
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_category_insert AFTER INSERT ON tasks
+    WHEN NEW.category IS NOT NULL
+    BEGIN
+        INSERT INTO task_categories (name, task_count) VALUES (NEW.category, 1)
+        ON CONFLICT(name) DO UPDATE SET task_count = task_count + 1;
+    END
+    """)
+
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_category_delete AFTER DELETE ON tasks
+    WHEN OLD.category IS NOT NULL
+    BEGIN
+        UPDATE task_categories SET task_count = task_count - 1 WHERE name = OLD.category;
+        DELETE FROM task_categories
+        WHERE name = OLD.category AND task_count <= 0 AND is_default = 0;
+    END
+    """)
+
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_category_update AFTER UPDATE OF category ON tasks
+    WHEN OLD.category IS NOT NEW.category
+    BEGIN
+        UPDATE task_categories SET task_count = task_count - 1 WHERE name = OLD.category;
+        DELETE FROM task_categories
+        WHERE name = OLD.category AND task_count <= 0 AND is_default = 0;
+        INSERT INTO task_categories (name, task_count)
+        SELECT NEW.category, 1 WHERE NEW.category IS NOT NULL
+        ON CONFLICT(name) DO UPDATE SET task_count = task_count + 1;
+    END
+    """)
+
+    # Transaction archives (see archive.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS transaction_archives (
+        year INTEGER PRIMARY KEY,
+        path TEXT NOT NULL,
+        row_count INTEGER NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # month totals of archived transactions, so dashboards never open archives
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS transaction_rollups (
+        month TEXT NOT NULL,         -- YYYY-MM
+        category_id INTEGER,
+        type TEXT NOT NULL,
+        total REAL NOT NULL,
+        tx_count INTEGER NOT NULL,
+        unconverted INTEGER NOT NULL DEFAULT 0   -- of tx_count, had no rate (not in total)
+    )
+    """)
+    cur.execute("PRAGMA table_info(transaction_rollups)")
+    if "unconverted" not in [c["name"] for c in cur.fetchall()]:
+        cur.execute("ALTER TABLE transaction_rollups ADD COLUMN unconverted INTEGER NOT NULL DEFAULT 0")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_rollups_month ON transaction_rollups (month, type)")
+
+    # Shared cache (see cached() below): one generation counter per namespace,
+    # bumped by triggers so a write from any worker process invalidates it.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS cache_generations (
+        namespace TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        key TEXT PRIMARY KEY,
+        namespace TEXT NOT NULL,
+        generation INTEGER NOT NULL,
+        value TEXT NOT NULL
+    )
+    """)
+
+    # entries were computed by the code that wrote them; a deploy may change
+    # what a cached function returns, so start every release with an empty cache
+    cur.execute("DELETE FROM cache_entries")
+
+    for table, namespace in CACHE_NAMESPACES.items():
+        cur.execute("INSERT OR IGNORE INTO cache_generations (namespace) VALUES (?)", (namespace,))
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_cache_{table}_{op.lower()} AFTER {op} ON {table}
+            BEGIN
+                UPDATE cache_generations SET generation = generation + 1 WHERE namespace = '{namespace}';
+            END
+            """)
+
+    # Background jobs (see jobs.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        args TEXT NOT NULL DEFAULT '{}',  -- JSON, sorted keys
+        priority INTEGER DEFAULT 0,       -- higher runs first
+        status TEXT DEFAULT 'queued',     -- 'queued','running','done','failed'
+        attempts INTEGER DEFAULT 0,
+        max_attempts INTEGER DEFAULT 3,
+        run_at TEXT DEFAULT (datetime('now')),
+        locked_at TEXT,
+        result TEXT,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TEXT
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, run_at)")
+    # at most one identical job waiting or running; replaces idx_jobs_dedup,
+    # which only covered queued jobs
+    cur.execute("DROP INDEX IF EXISTS idx_jobs_dedup")
+    cur.execute("""
+        UPDATE jobs SET status='done', error='superseded by a running copy', finished_at=datetime('now')
+        WHERE status='queued' AND EXISTS (
+            SELECT 1 FROM jobs r WHERE r.status='running' AND r.name=jobs.name AND r.args=jobs.args
+        )
+    """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active
+        ON jobs (name, args) WHERE status IN ('queued', 'running')
+    """)
+
+    # archives from before the single-file layout (one database per year)
+    cur.execute("SELECT year, path FROM transaction_archives WHERE path != ?", (TX_ARCHIVE_DB,))
+    legacy = cur.fetchall()
+    if legacy:
+        conn.commit()
+        _merge_legacy_archives(conn, legacy)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)")
+
+    # Change log: every insert/update/delete on CHANGE_LOG_TABLES gets a new,
+    # monotonically increasing version. user_id is set for per-user rows
+    # (events) and NULL for shared ones.
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='change_log'")
+    backfill = cur.fetchone() is None
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_log (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL,            -- 'upsert' or 'delete'
+        user_id INTEGER,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_id, version)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_log_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        tombstone_floor INTEGER NOT NULL DEFAULT 0,  -- deletes up to here were compacted away
+        archiving INTEGER NOT NULL DEFAULT 0         -- set by archive.py while it moves rows
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO change_log_state (id) VALUES (1)")
+    cur.execute("PRAGMA table_info(change_log_state)")
+    if "archiving" not in [c["name"] for c in cur.fetchall()]:
+        cur.execute("ALTER TABLE change_log_state ADD COLUMN archiving INTEGER NOT NULL DEFAULT 0")
+        # recreated below with the archiving check
+        cur.execute("DROP TRIGGER IF EXISTS trg_changes_transactions_delete")
+
+    for table in CHANGE_LOG_TABLES:
+        user_col = "user_id" if table == "events" else "NULL"
+        if backfill:
+            # rows that predate the log are handed out as one upsert each
+            cur.execute(f"""
+                INSERT INTO change_log (table_name, row_id, op, user_id)
+                SELECT '{table}', id, 'upsert', {user_col} FROM {table}
+            """)
+        for op, row, kind in (("INSERT", "NEW", "upsert"), ("UPDATE", "NEW", "upsert"), ("DELETE", "OLD", "delete")):
+            owner = f"{row}.user_id" if table == "events" else "NULL"
+            # rows moved to the archive still exist: no tombstone for them
+            when = (
+                "WHEN (SELECT archiving FROM change_log_state WHERE id = 1) = 0"
+                if table == "transactions" and op == "DELETE" else ""
+            )
+            cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_{op.lower()} AFTER {op} ON {table}
+            {when}
+            BEGIN
+                INSERT INTO change_log (table_name, row_id, op, user_id)
+                VALUES ('{table}', {row}.id, '{kind}', {owner});
+            END
+            """)
+
+    # due-reminder scans by the live publisher (see live.py)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_reminder ON events (reminder_at)")
+
+    # latest-N history lookups walk this index backwards instead of sorting
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_user_created ON history (user_id, created_at, id)")
+
+    # prune_history() only re-checks the cap of users who logged commands
+    # after checked_id, the last history id it has looked at
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS history_prune_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        checked_id INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO history_prune_state (id) VALUES (1)")
+
+    # Indexes backing the keyset-paginated task listing, one per filter shape
+    # so each walks its index in (sort key, id) order: no filter, category,
+    # category + priority (a priority alone filters idx_tasks_due's rows)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks ({TASK_SORT_KEY}, id)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_cat_due ON tasks (category, {TASK_SORT_KEY}, id)")
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_tasks_cat_pri_due
+        ON tasks (category, priority, {TASK_SORT_KEY}, id)
+    """)
+
+    # Pomodoro focus sessions: append-only, written in batches by
+    # add_focus_sessions(). client_id makes a re-sent buffer a no-op.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS focus_sessions (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        client_id TEXT NOT NULL,
+        task_id INTEGER,
+        category TEXT NOT NULL,
+        started_at TEXT NOT NULL,        -- local time, YYYY-MM-DDTHH:MM:SS
+        seconds INTEGER NOT NULL,
+        completed INTEGER NOT NULL DEFAULT 1,
+        UNIQUE (user_id, client_id)
+    )
+    """)
+
+    # Rollups kept current by the trigger below, so insights never read
+    # focus_sessions. bucket is the day, or the Monday of the week.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS focus_rollups (
+        user_id INTEGER NOT NULL,
+        period TEXT NOT NULL,            -- 'day' | 'week'
+        bucket TEXT NOT NULL,
+        category TEXT NOT NULL,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        seconds INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, period, bucket, category)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS focus_task_totals (
+        task_id INTEGER PRIMARY KEY,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        seconds INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_focus_rollup AFTER INSERT ON focus_sessions
+    BEGIN
+        INSERT INTO focus_rollups (user_id, period, bucket, category, sessions, seconds)
+        VALUES (NEW.user_id, 'day', date(NEW.started_at), NEW.category, 1, NEW.seconds),
+               (NEW.user_id, 'week', date(NEW.started_at, 'weekday 0', '-6 days'), NEW.category, 1, NEW.seconds)
+        ON CONFLICT (user_id, period, bucket, category) DO UPDATE
+        SET sessions = sessions + 1, seconds = seconds + excluded.seconds;
+
+        INSERT INTO focus_task_totals (task_id, sessions, seconds)
+        SELECT NEW.task_id, 1, NEW.seconds WHERE NEW.task_id IS NOT NULL
+        ON CONFLICT (task_id) DO UPDATE
+        SET sessions = sessions + 1, seconds = seconds + excluded.seconds;
+    END
+    """)
+
+    # When tasks get completed, for focus-to-completion ratios. Kept after
+    # the task is deleted (clear_completed) so history stays intact.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS task_completions (
+        task_id INTEGER PRIMARY KEY,
+        category TEXT,
+        completed_on TEXT NOT NULL
+    ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_task_completions_day ON task_completions (completed_on)")
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_completed AFTER UPDATE OF completed ON tasks
+    WHEN OLD.completed IS NOT NEW.completed
+    BEGIN
+        INSERT OR REPLACE INTO task_completions (task_id, category, completed_on)
+        SELECT NEW.id, NEW.category, date('now', 'localtime') WHERE NEW.completed = 1;
+        DELETE FROM task_completions WHERE task_id = NEW.id AND NEW.completed = 0;
+    END
+    """)
+
     conn.commit()
     conn.close()
 
+def tx_archive_table(year):
+    return f"transactions_{int(year)}"
+
+
+def create_archive_table(cur, year):
+    """Create the archive table for `year` in the database attached as arc."""
+    table = tx_archive_table(year)
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS arc.{table} (
+        id INTEGER PRIMARY KEY,
+        amount REAL NOT NULL,
+        currency TEXT NOT NULL DEFAULT '{BASE_CURRENCY}',
+        category_id INTEGER,
+        type TEXT NOT NULL,
+        date TEXT NOT NULL,
+        payment_method TEXT,
+        description TEXT,
+        created_at TIMESTAMP
+    )
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS arc.idx_{table}_date ON {table} (date)")
+
+
+def _merge_legacy_archives(conn, legacy):
+    """Copy per-year archive files into TX_ARCHIVE_DB; the old files are left in place."""
+    os.makedirs(TX_ARCHIVE_DIR, exist_ok=True)
+    cur = conn.cursor()
+    cur.execute("ATTACH DATABASE ? AS arc", (TX_ARCHIVE_DB,))
+    for arc in legacy:
+        if os.path.exists(arc["path"]):
+            cur.execute("ATTACH DATABASE ? AS legacy", (arc["path"],))
+            cur.execute("PRAGMA legacy.table_info(transactions)")
+            present = {c["name"] for c in cur.fetchall()}
+            # files written before multi-currency have no currency column
+            columns = ", ".join(c for c in TX_COLUMNS if c in present)
+            create_archive_table(cur, arc["year"])
+            cur.execute(f"""
+                INSERT OR IGNORE INTO arc.{tx_archive_table(arc["year"])} ({columns})
+                SELECT {columns} FROM legacy.transactions
+            """)
+            conn.commit()
+            cur.execute("DETACH DATABASE legacy")
+        cur.execute("UPDATE transaction_archives SET path=? WHERE year=?", (TX_ARCHIVE_DB, arc["year"]))
+        conn.commit()
+    cur.execute("DETACH DATABASE arc")
+
+# ---------------- SHARED CACHE ----------------
+_local_cache = {}
+
+
+def cached(namespace):
+    """
+    Cache a read function's (JSON-serializable) result across all worker
+    processes. Entries are tagged with the namespace generation read *before*
+    computing them, so a concurrent write can only ever leave a stale entry
+    under an already outdated generation, which is never served.
+    Sharing a miss is best effort: it never waits for the write lock, so a
+    GET is not held up behind other workers' writes.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = f"{fn.__name__}:{json.dumps([args, kwargs], sort_keys=True)}"
+            conn = get_conn(); cur = conn.cursor()
+            try:
+                cur.execute("SELECT generation FROM cache_generations WHERE namespace=?", (namespace,))
+                generation = cur.fetchone()["generation"]
+
+                hit = _local_cache.get(key)
+                if hit and hit[0] == generation:
+                    return hit[1]
+
+                cur.execute("SELECT value FROM cache_entries WHERE key=? AND generation=?", (key, generation))
+                row = cur.fetchone()
+                if row:
+                    value = json.loads(row["value"])
+                else:
+                    encoded = json.dumps(fn(*args, **kwargs))
+                    value = json.loads(encoded)
+                    try:
+                        cur.execute("PRAGMA busy_timeout = 0")
+                        cur.execute(
+                            "INSERT OR REPLACE INTO cache_entries (key, namespace, generation, value) VALUES (?, ?, ?, ?)",
+                            (key, namespace, generation, encoded)
+                        )
+                        conn.commit()
+                    except sqlite3.OperationalError:
+                        # database busy: still serve the value, just don't share it
+                        conn.rollback()
+
+                _local_cache[key] = (generation, value)
+                return value
+            finally:
+                conn.close()
+        return wrapper
+    return decorator
+
+
 # ---------------- USER AUTH FUNCTIONS ----------------
 
 def get_user_by_username(username):
@@ -171,8 +713,8 @@ def add_task(task, category, priority, due_date):
     conn.commit(); conn.close()
 
 
-def get_tasks(search="", category="", priority="", sort_by="due_date"):
-    conn = get_conn(); cur = conn.cursor()
+def get_tasks(search="", category="", priority="", sort_by="due_date", stream=False):
+    conn = get_conn()
     query = "SELECT * FROM tasks WHERE 1=1"
     params = []
 
@@ -193,9 +735,7 @@ def get_tasks(search="", category="", priority="", sort_by="due_date"):
     else:
         query += " ORDER BY CASE WHEN due_date IS NULL THEN 1 ELSE 0 END, due_date"
 
-    cur.execute(query, params)
-    rows = cur.fetchall(); conn.close()
-    return rows
+    return fetch_records(conn, query, params, stream)
 
 
 def get_task(task_id):
@@ -230,12 +770,61 @@ def clear_completed():
     conn.commit(); conn.close()
 
 
-def get_categories():
+@cached("tasks")
+def get_categories(include_all=True):
     conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT DISTINCT category FROM tasks")
+    cur.execute("SELECT name FROM task_categories ORDER BY is_default DESC, rowid")
     rows = cur.fetchall()
     conn.close()
-    return ["All"] + [r["category"] for r in rows]
+    names = [r["name"] for r in rows]
+    return ["All"] + names if include_all else names
+
+
+def get_tasks_page(search="", category="", priority="", cursor=None, limit=TASK_PAGE_SIZE, pending_only=False):
+    """
+    Keyset-paginated task listing ordered by due date (undated last), then id.
+    cursor is the opaque string returned as next_cursor by the previous page;
+    pending_only leaves out completed tasks.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    query = f"SELECT *, {TASK_SORT_KEY} AS sort_key FROM tasks WHERE 1=1"
+    params = []
+
+    if category and category != "All":
+        query += " AND category=?"
+        params.append(category)
+
+    if priority and priority != "All":
+        query += " AND priority=?"
+        params.append(priority)
+
+    if search:
+        query += " AND task LIKE ?"
+        params.append(f"%{search}%")
+
+    if pending_only:
+        query += " AND completed=0"
+
+    if cursor:
+        sort_key, last_id = cursor.rsplit("|", 1)
+        # the plain >= bound is what lets SQLite seek the index to the cursor;
+        # it does not use the row-value comparison on an expression for that
+        query += f" AND {TASK_SORT_KEY} >= ? AND ({TASK_SORT_KEY}, id) > (?, ?)"
+        params.extend([sort_key, sort_key, int(last_id)])
+
+    # fetch one extra row to know whether another page exists
+    query += f" ORDER BY {TASK_SORT_KEY}, id LIMIT ?"
+    params.append(limit + 1)
+
+    cur.execute(query, params)
+    rows = cur.fetchall(); conn.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['sort_key']}|{rows[-1]['id']}"
+    return rows, next_cursor
 
 
 # ---------------- EVENTS ----------------
@@ -248,18 +837,14 @@ def add_event(user_id, title, date, time, category, important, reminder_at, note
     conn.commit(); conn.close()
 
 
-def get_events_for_user(user_id):
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT * FROM events WHERE user_id=? ORDER BY date, time", (user_id,))
-    rows = cur.fetchall(); conn.close()
-    return rows
+def get_events_for_user(user_id, stream=False):
+    conn = get_conn()
+    return fetch_records(conn, "SELECT * FROM events WHERE user_id=? ORDER BY date, time", (user_id,), stream)
 
 
 def get_events_for_date(user_id, d):
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT * FROM events WHERE user_id=? AND date=? ORDER BY time", (user_id, d))
-    rows = cur.fetchall(); conn.close()
-    return rows
+    conn = get_conn()
+    return fetch_records(conn, "SELECT * FROM events WHERE user_id=? AND date=? ORDER BY time", (user_id, d))
 
 
 def get_event(event_id):
@@ -285,14 +870,87 @@ def delete_event(event_id):
 
 
 def get_upcoming_events(user_id, limit=10):
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("""
+    conn = get_conn()
+    return fetch_records(conn, """
         SELECT * FROM events
         WHERE user_id=? AND date >= date('now')
         ORDER BY date, time LIMIT ?
     """, (user_id, limit))
-    rows = cur.fetchall(); conn.close()
-    return rows
+
+
+# ---------------- FOCUS SESSIONS ----------------
+def add_focus_sessions(user_id, sessions):
+    """
+    Store a flushed client buffer of pomodoro sessions in one transaction.
+    sessions are validated dicts (client_id, task_id, category, started_at,
+    seconds, completed); a session linked to a task and sent without a
+    category takes the task's. Returns how many were new.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    cur.executemany("""
+        INSERT OR IGNORE INTO focus_sessions
+            (user_id, client_id, task_id, category, started_at, seconds, completed)
+        VALUES (?, ?, ?, COALESCE(?, (SELECT category FROM tasks WHERE id=?), 'General'), ?, ?, ?)
+    """, [
+        (user_id, s["client_id"], s["task_id"], s["category"], s["task_id"],
+         s["started_at"], s["seconds"], s["completed"])
+        for s in sessions
+    ])
+    # rows actually inserted (ignored duplicates and trigger writes don't count)
+    stored = cur.rowcount
+    conn.commit(); conn.close()
+    return stored
+
+
+def get_focus_trend(user_id, period, since):
+    """Sessions and seconds of focus per day or week (period), from `since` on."""
+    conn = get_conn()
+    return fetch_records(conn, """
+        SELECT bucket, SUM(sessions) AS sessions, SUM(seconds) AS seconds
+        FROM focus_rollups
+        WHERE user_id=? AND period=? AND bucket >= ?
+        GROUP BY bucket ORDER BY bucket
+    """, (user_id, period, since))
+
+
+def get_completions_by_day(since):
+    conn = get_conn()
+    return fetch_records(conn, """
+        SELECT completed_on AS day, COUNT(*) AS completed
+        FROM task_completions WHERE completed_on >= ?
+        GROUP BY completed_on ORDER BY completed_on
+    """, (since,))
+
+
+def get_focus_by_category(user_id, since):
+    """
+    Focus time and completed tasks per category from `since` on, plus the
+    average focus spent on each completed task that had linked sessions.
+    """
+    conn = get_conn()
+    return fetch_records(conn, """
+        WITH focus AS (
+            SELECT category, SUM(sessions) AS sessions, SUM(seconds) AS seconds
+            FROM focus_rollups
+            WHERE user_id=? AND period='day' AND bucket >= ?
+            GROUP BY category
+        ), done AS (
+            SELECT COALESCE(c.category, 'General') AS category,
+                   COUNT(*) AS completed,
+                   AVG(f.seconds) AS focus_per_task
+            FROM task_completions c
+            LEFT JOIN focus_task_totals f ON f.task_id = c.task_id
+            WHERE c.completed_on >= ?
+            GROUP BY 1
+        )
+        SELECT focus.category AS category, focus.sessions, focus.seconds,
+               COALESCE(done.completed, 0) AS completed, done.focus_per_task
+        FROM focus LEFT JOIN done ON done.category = focus.category
+        UNION ALL
+        SELECT category, 0, 0, completed, focus_per_task
+        FROM done WHERE category NOT IN (SELECT category FROM focus)
+        ORDER BY 3 DESC, 4 DESC
+    """, (user_id, since, since))
 
 
 # ---------------- HISTORY ----------------
@@ -303,12 +961,121 @@ def log_command(user_id, text):
 
 
 def get_history(user_id, limit=50):
+    conn = get_conn()
+    return fetch_records(conn, """
+        SELECT * FROM history WHERE user_id=?
+        ORDER BY created_at DESC, id DESC LIMIT ?
+    """, (user_id, limit))
+
+
+def _history_partition(month):
+    # month is 'YYYY-MM' -> archive table history_YYYY_MM
+    return "history_" + month.replace("-", "_")
+
+
+def get_archived_history(user_id, month, limit=50):
+    """Archived commands of one user for one month ('YYYY-MM'), newest first."""
     conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT * FROM history WHERE user_id=? ORDER BY created_at DESC LIMIT ?", (user_id, limit))
+    cur.execute("ATTACH DATABASE ? AS archive", (HISTORY_ARCHIVE_DB,))
+    cur.execute("SELECT 1 FROM archive.sqlite_master WHERE type='table' AND name=?",
+                (_history_partition(month),))
+    if not cur.fetchone():
+        conn.close()
+        return []
+    cur.execute(f"""
+        SELECT * FROM archive.{_history_partition(month)} WHERE user_id=?
+        ORDER BY created_at DESC, id DESC LIMIT ?
+    """, (user_id, limit))
     rows = cur.fetchall(); conn.close()
     return rows
 
 
+def prune_history(batch_size=HISTORY_PRUNE_BATCH):
+    """
+    Move at most batch_size history rows that are older than the TTL, or
+    beyond a user's HISTORY_MAX_PER_USER most recent ones, into monthly
+    tables in HISTORY_ARCHIVE_DB. Meant to run repeatedly as a background
+    job; every step is bounded by batch_size, never by the table size or the
+    number of users: a user can only go over the cap by logging commands,
+    so only the authors of up to batch_size rows logged since the previous
+    run are checked. Returns the number of rows moved.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("ATTACH DATABASE ? AS archive", (HISTORY_ARCHIVE_DB,))
+    cur.execute("CREATE TEMP TABLE prune_ids (id INTEGER PRIMARY KEY)")
+
+    # expired rows: ids grow with created_at, so the oldest rows come first
+    cur.execute("""
+        INSERT INTO prune_ids
+        SELECT id FROM (SELECT id, created_at FROM history ORDER BY id LIMIT ?)
+        WHERE created_at < datetime('now', ?)
+    """, (batch_size, f"-{HISTORY_TTL_DAYS} days"))
+
+    # rows past each user's cap, found by jumping HISTORY_MAX_PER_USER
+    # entries down that user's index, for the users behind the next
+    # batch_size rows logged since the last checked one
+    cur.execute("SELECT checked_id FROM history_prune_state WHERE id=1")
+    checked_id = cur.fetchone()["checked_id"]
+    cur.execute("""
+        SELECT user_id, MIN(id) AS first_id, MAX(id) AS last_id
+        FROM (SELECT id, user_id FROM history WHERE id > ? ORDER BY id LIMIT ?)
+        GROUP BY user_id ORDER BY first_id
+    """, (checked_id, batch_size))
+    authors = cur.fetchall()
+    if authors:
+        checked_id = max(a["last_id"] for a in authors)
+    for user in authors:
+        room = batch_size - conn.execute("SELECT COUNT(*) FROM prune_ids").fetchone()[0]
+        boundary = conn.execute("""
+            SELECT created_at, id FROM history WHERE user_id=?
+            ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?
+        """, (user["user_id"], HISTORY_MAX_PER_USER)).fetchone()
+        if boundary and room > 0:
+            moved = conn.execute("""
+                INSERT INTO prune_ids
+                SELECT id FROM history
+                WHERE user_id=? AND (created_at, id) <= (?, ?)
+                  AND id NOT IN (SELECT id FROM prune_ids)
+                ORDER BY created_at, id LIMIT ?
+            """, (user["user_id"], boundary["created_at"], boundary["id"], room)).rowcount
+        if boundary and (room <= 0 or moved == room):
+            # batch full before this user was done: start from them next run
+            checked_id = user["first_id"] - 1
+            break
+
+    cur.execute("""
+        SELECT DISTINCT strftime('%Y-%m', created_at) AS month
+        FROM history WHERE id IN (SELECT id FROM prune_ids)
+    """)
+    months = [r["month"] for r in cur.fetchall()]
+
+    # copy first, delete second: the archive is a separate file, so a crash in
+    # between must leave duplicates (ignored on retry), never lost rows
+    for month in months:
+        table = _history_partition(month)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS archive.{table} (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                command TEXT,
+                created_at TIMESTAMP
+            )
+        """)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_user ON {table} (user_id, created_at)")
+        cur.execute(f"""
+            INSERT OR IGNORE INTO archive.{table} (id, user_id, command, created_at)
+            SELECT id, user_id, command, created_at FROM history
+            WHERE id IN (SELECT id FROM prune_ids) AND strftime('%Y-%m', created_at)=?
+        """, (month,))
+    conn.commit()
+
+    cur.execute("DELETE FROM history WHERE id IN (SELECT id FROM prune_ids)")
+    moved = cur.rowcount
+    cur.execute("UPDATE history_prune_state SET checked_id=? WHERE id=1", (checked_id,))
+    conn.commit(); conn.close()
+    return moved
+
+
 # ---------------- EXPENSE TRACKER ----------------
 def get_current_month():
     return datetime.now().strftime("%Y-%m")
@@ -340,20 +1107,129 @@ def delete_exp_category(cat_id):
     conn.commit(); conn.close()
 
 
+# ----- Currency conversion -----
+# Amount of transaction row `t` in BASE_CURRENCY, for use inside aggregates
+# together with FX_JOIN. fx_rates is loaded with one row per day, so the join
+# nearly always hits; past the last loaded day the latest earlier rate is used.
+# A currency without any rate gives NULL: such rows are left out of the sums
+# (which ignore NULL) and counted as "unconverted" by get_totals_by_month.
+FX_JOIN = "LEFT JOIN fx_rates fx ON fx.currency = t.currency AND fx.date = t.date"
+BASE_AMOUNT = f"""
+    (CASE WHEN t.currency = '{BASE_CURRENCY}' THEN t.amount
+          ELSE t.amount * COALESCE(
+              fx.rate,
+              (SELECT r.rate FROM fx_rates r
+               WHERE r.currency = t.currency AND r.date <= t.date
+               ORDER BY r.date DESC LIMIT 1))
+     END)
+"""
+
+CURRENCY_SYMBOLS = {"INR": "₹", "USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥"}
+
+
+def format_money(amount, currency=None):
+    """Amount with its currency's symbol (or ISO code); currency defaults to BASE_CURRENCY."""
+    currency = currency or BASE_CURRENCY
+    symbol = CURRENCY_SYMBOLS.get(currency)
+    if not symbol:
+        return f"{amount:,.2f} {currency}"
+    return f"-{symbol}{-amount:,.2f}" if amount < 0 else f"{symbol}{amount:,.2f}"
+
+
+@lru_cache(maxsize=8192)
+def _fx_rate(currency, on_date, epoch):
+    """Rate of on_date, else the latest earlier one, else None; epoch (see get_fx_rate) expires it."""
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("""
+        SELECT rate FROM fx_rates WHERE currency=? AND date<=?
+        ORDER BY date DESC LIMIT 1
+    """, (currency, on_date))
+    r = cur.fetchone(); conn.close()
+    return r["rate"] if r else None
+
+
+def get_fx_rate(currency, on_date):
+    """BASE_CURRENCY per 1 unit of currency on on_date (latest earlier rate if that day is missing)."""
+    if currency == BASE_CURRENCY:
+        return 1.0
+    # memoized per (currency, day), misses included: transactions after the
+    # last loaded day, or in a currency without rates, are the common case
+    # between loads. Entries expire after FX_RATE_TTL so a load made by
+    # another process (fx.py) is picked up.
+    return _fx_rate(currency, on_date, int(time.monotonic() // FX_RATE_TTL))
+
+
+def convert_amount(amount, currency, on_date):
+    rate = get_fx_rate(currency, on_date)
+    return round(amount * rate, 2) if rate is not None else None
+
+
+def get_currencies():
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("SELECT DISTINCT currency FROM fx_rates ORDER BY currency")
+    rows = cur.fetchall(); conn.close()
+    return [BASE_CURRENCY] + [r["currency"] for r in rows if r["currency"] != BASE_CURRENCY]
+
+
+# ----- Transaction sources (hot table + archives) -----
+def _month_bounds(month):
+    """'YYYY-MM' -> ('YYYY-MM-01', first day of the next month)."""
+    year, m = map(int, month.split("-"))
+    nxt = f"{year+1}-01" if m == 12 else f"{year}-{m+1:02d}"
+    return f"{month}-01", f"{nxt}-01"
+
+
+def get_archived_years():
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("SELECT * FROM transaction_archives ORDER BY year")
+    rows = cur.fetchall(); conn.close()
+    return rows
+
+
+def _archived_years(conn, date_from=None, date_to=None):
+    """Archived years overlapping [date_from, date_to] (either bound optional), oldest first."""
+    years = [r["year"] for r in conn.execute("SELECT year FROM transaction_archives ORDER BY year")]
+    return [
+        y for y in years
+        if not (date_from and date_from[:4] > str(y)) and not (date_to and date_to[:4] < str(y))
+    ]
+
+
+def _tx_source(conn, date_from=None, date_to=None, years=None):
+    """
+    FROM-clause source covering every transaction that may fall in
+    [date_from, date_to] (either bound optional): the hot table, plus the
+    tables of each archived year overlapping the range, read through one
+    read-only ATTACH. Rows carry an `archived` flag (0 / 1).
+    """
+    if years is None:
+        years = _archived_years(conn, date_from, date_to)
+    if not years:
+        return "(SELECT *, 0 AS archived FROM main.transactions)"
+
+    attached = [r["name"] for r in conn.execute("PRAGMA database_list")]
+    if "arc" not in attached:
+        conn.execute("ATTACH DATABASE ? AS arc", (f"file:{TX_ARCHIVE_DB}?mode=ro",))
+    columns = ", ".join(TX_COLUMNS)
+    sources = [f"SELECT {columns}, 0 AS archived FROM main.transactions"]
+    sources += [f"SELECT {columns}, 1 AS archived FROM arc.{tx_archive_table(y)}" for y in years]
+    return "(" + " UNION ALL ".join(sources) + ")"
+
+
 # ----- Transactions -----
-def add_transaction(amount, category_id, type_, date_str, payment_method, description):
+def add_transaction(amount, category_id, type_, date_str, payment_method, description, currency=BASE_CURRENCY):
     conn = get_conn(); cur = conn.cursor()
     cur.execute("""
-        INSERT INTO transactions (amount, category_id, type, date, payment_method, description)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (amount, category_id, type_, date_str, payment_method, description))
+        INSERT INTO transactions (amount, currency, category_id, type, date, payment_method, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (amount, currency, category_id, type_, date_str, payment_method, description))
     conn.commit(); conn.close()
 
 
 def get_transaction(tx_id: int):
     conn = get_conn(); cur = conn.cursor()
     cur.execute("""
-        SELECT t.id, t.amount, t.type, t.date,
+        SELECT t.id, t.amount, t.currency, t.type, t.date,
                t.payment_method, t.description,
                t.category_id,
                c.name AS category
@@ -366,67 +1242,95 @@ def get_transaction(tx_id: int):
     return row
 
 
-def update_transaction(tx_id, amount, category_id, type_, date_str, payment_method, description):
+def update_transaction(tx_id, amount, category_id, type_, date_str, payment_method, description, currency=BASE_CURRENCY):
     conn = get_conn(); cur = conn.cursor()
     cur.execute("""
         UPDATE transactions
-        SET amount=?, category_id=?, type=?, date=?,
+        SET amount=?, currency=?, category_id=?, type=?, date=?,
             payment_method=?, description=?
         WHERE id=?
-    """, (amount, category_id, type_, date_str, payment_method, description, tx_id))
+    """, (amount, currency, category_id, type_, date_str, payment_method, description, tx_id))
     conn.commit(); conn.close()
 
 
 def delete_transaction(tx_id):
+    """False if there is no such transaction in the hot table (archived rows are read-only)."""
     conn = get_conn(); cur = conn.cursor()
     cur.execute("DELETE FROM transactions WHERE id=?", (tx_id,))
+    deleted = cur.rowcount > 0
     conn.commit(); conn.close()
+    return deleted
 
 
+@cached("transactions")
 def get_recent_transactions(limit=10):
     conn = get_conn(); cur = conn.cursor()
-    cur.execute("""
-        SELECT t.*, c.name AS category 
-        FROM transactions t
+    query = """
+        SELECT t.*, c.name AS category
+        FROM {source} t
         LEFT JOIN exp_categories c ON t.category_id = c.id
         ORDER BY date DESC, id DESC LIMIT ?
-    """, (limit,))
-    rows = cur.fetchall(); conn.close()
-    return rows
+    """
+    cur.execute(query.format(source=_tx_source(conn, years=[])), (limit,))
+    rows = cur.fetchall()
+    if len(rows) < limit:
+        # the hot table is (nearly) empty, e.g. early in a new year
+        years = _archived_years(conn)
+        if years:
+            cur.execute(query.format(source=_tx_source(conn, years=years[-1:])), (limit,))
+            rows = cur.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
 
 
+@cached("transactions")
 def get_totals_by_month(month):
     conn = get_conn(); cur = conn.cursor()
 
-    cur.execute("""
+    start, end = _month_bounds(month)
+    cur.execute(f"""
         SELECT 
             COALESCE(SUM(CASE WHEN type='income' THEN amount END), 0) AS income,
-            COALESCE(SUM(CASE WHEN type='expense' THEN amount END), 0) AS expense
-        FROM transactions
-        WHERE strftime('%Y-%m', date)=?
-    """, (month,))
+            COALESCE(SUM(CASE WHEN type='expense' THEN amount END), 0) AS expense,
+            COALESCE(SUM(unconverted), 0) AS unconverted
+        FROM (
+            SELECT type, amount, amount IS NULL AS unconverted FROM (
+                SELECT t.type, {BASE_AMOUNT} AS amount FROM transactions t {FX_JOIN}
+                WHERE t.date >= ? AND t.date < ?
+            )
+            UNION ALL
+            SELECT type, total, unconverted FROM transaction_rollups WHERE month=?
+        )
+    """, (start, end, month))
 
     r = cur.fetchone(); conn.close()
     return {
         "income": r["income"],
         "expense": r["expense"],
-        "balance": r["income"] - r["expense"]
+        "balance": r["income"] - r["expense"],
+        # transactions in a currency with no rate loaded, not in the sums
+        "unconverted": r["unconverted"],
     }
 
 
+@cached("transactions")
 def get_category_totals(month):
     conn = get_conn(); cur = conn.cursor()
-    cur.execute("""
+    start, end = _month_bounds(month)
+    cur.execute(f"""
         SELECT c.name AS category, 
                COALESCE(SUM(t.amount), 0) AS total
         FROM exp_categories c
-        LEFT JOIN transactions t 
-            ON t.category_id=c.id 
-           AND t.type='expense'
-           AND strftime('%Y-%m', t.date)=?
+        LEFT JOIN (
+            SELECT t.category_id, {BASE_AMOUNT} AS amount FROM transactions t {FX_JOIN}
+            WHERE t.type='expense' AND t.date >= ? AND t.date < ?
+            UNION ALL
+            SELECT category_id, total FROM transaction_rollups
+            WHERE type='expense' AND month=?
+        ) t ON t.category_id=c.id
         GROUP BY c.id
         ORDER BY total DESC
-    """, (month,))
+    """, (start, end, month))
 
     rows = cur.fetchall(); conn.close()
     return (
@@ -435,18 +1339,20 @@ def get_category_totals(month):
     )
 
 
+@cached("transactions")
 def get_monthly_summary(month):
     conn = get_conn(); cur = conn.cursor()
-    cur.execute("""
+    start, end = _month_bounds(month)
+    cur.execute(f"""
         SELECT 
-            date,
-            SUM(CASE WHEN type='income' THEN amount ELSE 0 END) AS income,
-            SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) AS expense
-        FROM transactions
-        WHERE strftime('%Y-%m', date)=?
-        GROUP BY date
-        ORDER BY date
-    """, (month,))
+            t.date,
+            SUM(CASE WHEN t.type='income' THEN {BASE_AMOUNT} ELSE 0 END) AS income,
+            SUM(CASE WHEN t.type='expense' THEN {BASE_AMOUNT} ELSE 0 END) AS expense
+        FROM {_tx_source(conn, start, end)} t {FX_JOIN}
+        WHERE t.date >= ? AND t.date < ?
+        GROUP BY t.date
+        ORDER BY t.date
+    """, (start, end))
     rows = cur.fetchall(); conn.close()
 
     return (
@@ -459,7 +1365,12 @@ def get_monthly_summary(month):
 # ----- Budget -----
 def set_budget(month, amount):
     conn = get_conn(); cur = conn.cursor()
-    cur.execute("INSERT OR REPLACE INTO budgets (month, amount) VALUES (?, ?)", (month, amount))
+    # upsert rather than REPLACE: keeps the row id and fires the UPDATE
+    # trigger, so change_log sees an update instead of a silent delete
+    cur.execute("""
+        INSERT INTO budgets (month, amount) VALUES (?, ?)
+        ON CONFLICT(month) DO UPDATE SET amount=excluded.amount
+    """, (month, amount))
     conn.commit(); conn.close()
 
 
@@ -472,53 +1383,302 @@ def get_budget(month):
 
 
 # Filtering transactions
-def get_transactions(limit=500, offset=0, filters=None):
+def get_transactions(limit=500, offset=0, filters=None, stream=False):
     conn = get_conn(); cur = conn.cursor()
+    filters = filters or {}
 
-    query = """
-        SELECT t.id, t.amount, t.type, t.date,
-               t.payment_method, t.description,
+    where = "1=1"
+    params = []
+
+    if filters.get("type"):
+        where += " AND t.type=?"
+        params.append(filters["type"])
+
+    if filters.get("category_id"):
+        where += " AND t.category_id=?"
+        params.append(filters["category_id"])
+
+    if filters.get("payment_method"):
+        where += " AND t.payment_method=?"
+        params.append(filters["payment_method"])
+
+    if filters.get("date_from"):
+        where += " AND t.date>=date(?)"
+        params.append(filters["date_from"])
+
+    if filters.get("date_to"):
+        where += " AND t.date<=date(?)"
+        params.append(filters["date_to"])
+
+    if filters.get("search"):
+        like = f"%{filters['search']}%"
+        where += " AND (t.description LIKE ? OR c.name LIKE ?)"
+        params.extend([like, like])
+
+    years = _archived_years(conn, filters.get("date_from"), filters.get("date_to"))
+    if years and limit != -1:
+        # Newest first: when the hot table has a full page dated after every
+        # archived year, the archive can't contribute and isn't opened.
+        cur.execute(f"""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM main.transactions t
+                LEFT JOIN exp_categories c ON t.category_id = c.id
+                WHERE {where} AND t.date >= ? LIMIT ?
+            )
+        """, params + [f"{years[-1] + 1}-01-01", limit + offset])
+        if cur.fetchone()[0] == limit + offset:
+            years = []
+
+    query = f"""
+        SELECT t.id, t.amount, t.currency, t.type, t.date,
+               t.payment_method, t.description, t.archived,
                c.name as category
-        FROM transactions t
+        FROM {_tx_source(conn, years=years)} t
         LEFT JOIN exp_categories c ON t.category_id = c.id
-        WHERE 1=1
+        WHERE {where}
+        ORDER BY t.date DESC, t.id DESC LIMIT ? OFFSET ?
     """
+    return fetch_records(conn, query, params + [limit, offset], stream)
 
-    params = []
 
-    if filters:
-        if filters.get("type"):
-            query += " AND t.type=?"
-            params.append(filters["type"])
+# ---------------- BATCH ----------------
+# entity name -> (table, writable columns, column flipped by a "toggle")
+BATCH_ENTITIES = {
+    "task": ("tasks", ("task", "category", "priority", "due_date"), "completed"),
+    "event": ("events", ("title", "date", "time", "category", "important", "reminder_at", "notes"), "important"),
+    "transaction": ("transactions", ("amount", "currency", "category_id", "type", "date", "payment_method", "description"), None),
+}
 
-        if filters.get("category_id"):
-            query += " AND t.category_id=?"
-            params.append(filters["category_id"])
 
-        if filters.get("payment_method"):
-            query += " AND t.payment_method=?"
-            params.append(filters["payment_method"])
+def _owner_clause(table):
+    # events are the only per-user table; everything else is shared
+    return " AND user_id=?" if table == "events" else ""
 
-        if filters.get("date_from"):
-            query += " AND date(t.date)>=date(?)"
-            params.append(filters["date_from"])
 
-        if filters.get("date_to"):
-            query += " AND date(t.date)<=date(?)"
-            params.append(filters["date_to"])
+def add_rows_bulk(cur, entity, columns, rows, user_id=None):
+    """
+    Insert many rows sharing the same column set with one executemany.
+    Returns the new ids, in order.
+    """
+    table = BATCH_ENTITIES[entity][0]
+    if table == "events":
+        columns = ("user_id",) + tuple(columns)
+        rows = [(user_id,) + tuple(r) for r in rows]
+    placeholders = ", ".join("?" for _ in columns)
+    cur.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+    # AUTOINCREMENT ids are handed out consecutively while we hold the write lock
+    last_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+
+def update_rows_bulk(cur, entity, columns, rows, user_id=None):
+    """
+    rows are (value, ..., id) tuples matching columns.
+    """
+    table = BATCH_ENTITIES[entity][0]
+    assignments = ", ".join(f"{c}=?" for c in columns)
+    query = f"UPDATE {table} SET {assignments} WHERE id=?" + _owner_clause(table)
+    if table == "events":
+        rows = [tuple(r) + (user_id,) for r in rows]
+    cur.executemany(query, rows)
 
-        if filters.get("search"):
-            like = f"%{filters['search']}%"
-            query += " AND (t.description LIKE ? OR c.name LIKE ?)"
-            params.extend([like, like])
 
-    query += " ORDER BY t.date DESC, t.id DESC LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
+def delete_rows_bulk(cur, entity, ids, user_id=None):
+    table = BATCH_ENTITIES[entity][0]
+    query = f"DELETE FROM {table} WHERE id=?" + _owner_clause(table)
+    cur.executemany(query, [(i, user_id) if table == "events" else (i,) for i in ids])
 
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+
+def toggle_rows_bulk(cur, entity, ids, user_id=None):
+    table, _, flag = BATCH_ENTITIES[entity]
+    query = f"UPDATE {table} SET {flag}=1-{flag} WHERE id=?" + _owner_clause(table)
+    cur.executemany(query, [(i, user_id) if table == "events" else (i,) for i in ids])
+
+
+def _find_missing_ids(cur, user_id, ops):
+    """
+    Return {op index: error} for update/delete/toggle ops whose id does not
+    exist (or was deleted earlier in the same batch).
+    """
+    wanted = {}
+    for op in ops:
+        if op["op"] != "create":
+            wanted.setdefault(op["entity"], set()).add(op["id"])
+
+    existing = {}
+    for entity, ids in wanted.items():
+        table = BATCH_ENTITIES[entity][0]
+        ids = list(ids)
+        found = set()
+        # stay below SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            params = chunk + ([user_id] if table == "events" else [])
+            cur.execute(
+                f"SELECT id FROM {table} WHERE id IN ({', '.join('?' for _ in chunk)})" + _owner_clause(table),
+                params
+            )
+            found.update(r["id"] for r in cur.fetchall())
+        existing[entity] = found
+
+    errors = {}
+    for i, op in enumerate(ops):
+        if op["op"] == "create":
+            continue
+        if op["id"] not in existing[op["entity"]]:
+            errors[i] = f"{op['entity']} {op['id']} not found"
+        elif op["op"] == "delete":
+            existing[op["entity"]].discard(op["id"])
+    return errors
+
+
+def apply_batch(user_id, ops):
+    """
+    Apply validated operations atomically in a single transaction.
+    Each op is {"op": create|update|delete|toggle, "entity": task|event|transaction,
+    "id": int (not for create), "values": {column: value}}.
+    Consecutive ops of the same kind are written with one executemany.
+    Returns (results, errors); when errors is non-empty nothing was applied.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        errors = _find_missing_ids(cur, user_id, ops)
+        if errors:
+            conn.rollback()
+            return [], errors
+
+        results = [None] * len(ops)
+
+        def run_key(item):
+            op = item[1]
+            return op["entity"], op["op"], tuple(op.get("values", {}))
+
+        for (entity, kind, columns), run in groupby(enumerate(ops), key=run_key):
+            run = list(run)
+            if kind == "create":
+                ids = add_rows_bulk(cur, entity, columns,
+                                    [tuple(op["values"].values()) for _, op in run], user_id)
+            else:
+                ids = [op["id"] for _, op in run]
+                if kind == "update":
+                    update_rows_bulk(cur, entity, columns,
+                                     [tuple(op["values"].values()) + (op["id"],) for _, op in run], user_id)
+                elif kind == "delete":
+                    delete_rows_bulk(cur, entity, ids, user_id)
+                elif kind == "toggle":
+                    toggle_rows_bulk(cur, entity, ids, user_id)
+
+            for (i, _), row_id in zip(run, ids):
+                results[i] = {"index": i, "ok": True, "id": row_id}
+
+        conn.commit()
+        return results, {}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ---------------- CHANGE LOG (delta sync) ----------------
+def get_changes(user_id, since=0, limit=CHANGES_PAGE_SIZE):
+    """
+    Rows of CHANGE_LOG_TABLES changed after version `since`, each reported
+    once with its latest state. Returns a dict with:
+      changes  - [{"table", "id", "op", "version", "row"}], oldest first;
+                 row is the current row for upserts and None for deletes
+      version  - pass back as `since` next time
+      has_more - another page is waiting
+      reset    - deletes after `since` were compacted away: the client must
+                 drop its copy and sync again from since=0
+    Transactions moved to the archive produce no change (they are neither
+    deleted nor changed any more) and are not part of a since=0 sync; a
+    client fetches them per year from /api/transactions/archive.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        # one read transaction, so log and rows come from the same snapshot
+        cur.execute("BEGIN")
+        cur.execute("SELECT tombstone_floor FROM change_log_state WHERE id=1")
+        if 0 < since < cur.fetchone()["tombstone_floor"]:
+            return {"changes": [], "version": 0, "has_more": False, "reset": True}
+
+        cur.execute("""
+            SELECT table_name, row_id, op, MAX(version) AS version
+            FROM change_log
+            WHERE version > ? AND (user_id IS NULL OR user_id = ?)
+            GROUP BY table_name, row_id
+            ORDER BY version
+            LIMIT ?
+        """, (since, user_id, limit + 1))
+        entries = cur.fetchall()
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        rows = {}
+        for table in CHANGE_LOG_TABLES:
+            ids = [e["row_id"] for e in entries if e["table_name"] == table and e["op"] == "upsert"]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cur.execute(f"SELECT * FROM {table} WHERE id IN ({', '.join('?' for _ in chunk)})", chunk)
+                rows.update(((table, r["id"]), dict(r)) for r in cur.fetchall())
+
+        if entries:
+            version = entries[-1]["version"]
+        else:
+            cur.execute("SELECT COALESCE(MAX(version), ?) AS v FROM change_log", (since,))
+            version = max(since, cur.fetchone()["v"])
+
+        return {
+            "changes": [
+                {
+                    "table": e["table_name"],
+                    "id": e["row_id"],
+                    "op": e["op"],
+                    "version": e["version"],
+                    "row": rows.get((e["table_name"], e["row_id"])) if e["op"] == "upsert" else None,
+                }
+                for e in entries
+            ],
+            "version": version,
+            "has_more": has_more,
+            "reset": False,
+        }
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def compact_change_log():
+    """
+    Keep only the latest entry per row, and drop delete tombstones older
+    than CHANGE_LOG_TOMBSTONE_DAYS (remembering how far, for get_changes'
+    reset). Since every live row keeps its latest entry, since=0 always
+    returns the full current state. Returns entries removed.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("""
+        DELETE FROM change_log
+        WHERE version < (
+            SELECT MAX(c2.version) FROM change_log c2
+            WHERE c2.table_name = change_log.table_name AND c2.row_id = change_log.row_id
+        )
+    """)
+    removed = cur.rowcount
+
+    cur.execute("""
+        SELECT MAX(version) AS v FROM change_log
+        WHERE op='delete' AND changed_at < datetime('now', ?)
+    """, (f"-{CHANGE_LOG_TOMBSTONE_DAYS} days",))
+    floor = cur.fetchone()["v"]
+    if floor:
+        cur.execute("DELETE FROM change_log WHERE op='delete' AND version <= ?", (floor,))
+        removed += cur.rowcount
+        cur.execute("UPDATE change_log_state SET tombstone_floor=MAX(tombstone_floor, ?) WHERE id=1", (floor,))
+
+    conn.commit(); conn.close()
+    return removed
 
 
 # ---------------- Recurring Transactions Helpers ----------------
@@ -596,23 +1756,38 @@ def insert_transaction_from_recurring(rec):
 # High-level: process due recurring transactions up to today
 def process_recurring_transactions(today_str=None):
     """
-    Should be called periodically (on app start and on transactions page load).
-    It will insert due transactions and update next_date forward until next_date > today.
+    Insert every due occurrence of the active recurring transactions and move
+    their next_date past today. Runs as one write transaction (BEGIN
+    IMMEDIATE), so two overlapping runs can't insert the same occurrences:
+    the second waits for the first, then finds nothing due.
     """
     if not today_str:
         today_str = datetime.now().date().isoformat()
+    today = datetime.strptime(today_str, "%Y-%m-%d").date()
 
-    due_list = get_recurring_due_dates(today_str)
-    for rec in due_list:
-        # keep advancing until next_date > today
-        next_date = rec["next_date"]
-        while datetime.strptime(next_date, "%Y-%m-%d").date() <= datetime.strptime(today_str, "%Y-%m-%d").date():
-            # insert transaction for next_date
-            insert_transaction_from_recurring(rec)
-            # advance
-            next_date = _advance_next_date(next_date, rec["frequency"], rec["every"])
-        # update the recurring row with new next_date
-        update_recurring_next_date(rec["id"], next_date)
+    conn = get_conn(); cur = conn.cursor()
+    inserted = 0
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT * FROM recurring_transactions WHERE active=1 AND DATE(next_date) <= DATE(?)", (today_str,))
+        for rec in cur.fetchall():
+            # keep advancing until next_date > today, one transaction per occurrence
+            next_date = rec["next_date"]
+            while datetime.strptime(next_date, "%Y-%m-%d").date() <= today:
+                cur.execute("""
+                    INSERT INTO transactions (amount, category_id, type, date, payment_method, description)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (rec["amount"], rec["category_id"], rec["type"], next_date, rec["payment_method"], rec["description"]))
+                inserted += 1
+                next_date = _advance_next_date(next_date, rec["frequency"], rec["every"])
+            cur.execute("UPDATE recurring_transactions SET next_date=? WHERE id=?", (next_date, rec["id"]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return {"inserted": inserted}
 
 # ---------------- Savings Goals ----------------
 
@@ -635,15 +1810,17 @@ def get_goal_progress(goal_row):
     Compute progress for a goal:
     - look for transactions whose description contains the goal name (case-insensitive)
     - also include transactions with category name 'Savings' if present
+    - only from the goal's start date on, so archived years before it stay closed
     """
     conn = get_conn(); cur = conn.cursor()
     name = goal_row["name"]
     like = f"%{name}%"
-    cur.execute("""
-        SELECT COALESCE(SUM(CASE WHEN type='income' THEN amount WHEN type='expense' THEN -amount END),0) as total
-        FROM transactions
-        WHERE description LIKE ?
-    """, (like,))
+    start = goal_row["start_date"]
+    cur.execute(f"""
+        SELECT COALESCE(SUM(CASE WHEN t.type='income' THEN {BASE_AMOUNT} WHEN t.type='expense' THEN -{BASE_AMOUNT} END),0) as total
+        FROM {_tx_source(conn, start)} t {FX_JOIN}
+        WHERE t.description LIKE ? AND t.date >= date(?)
+    """, (like, start))
     row = cur.fetchone()
     conn.close()
     saved = row["total"] if row else 0.0
@@ -0,0 +1,63 @@
+# fx.py - load daily exchange rates into fx_rates
+#
+#   python fx.py rates.csv
+#
+# The CSV has a header row with date,currency,rate where rate is the amount of
+# BASE_CURRENCY one unit of currency buys on that date (e.g. 2025-01-02,USD,85.6).
+# Gaps between two loaded days of a currency (weekends, holidays) are filled
+# with the previous day's rate, so the dashboards' per-day join always hits.
+# Re-loading a day overwrites it. Archived years keep the rollups computed when
+# they were archived; re-run archive.py for a year to pick up corrected rates.
+import csv
+import sys
+from datetime import date, timedelta
+
+from database import get_conn, init_db, _fx_rate, BASE_CURRENCY
+
+
+def _forward_fill(rates):
+    """{(currency, date): rate} -> rows with one entry per day between each currency's first and last date."""
+    by_currency = {}
+    for (currency, day), rate in rates.items():
+        by_currency.setdefault(currency, {})[day] = rate
+
+    rows = []
+    for currency, days in by_currency.items():
+        day, last = min(days), max(days)
+        rate = days[day]
+        while day <= last:
+            rate = days.get(day, rate)
+            rows.append((currency, day.isoformat(), rate))
+            day += timedelta(days=1)
+    return rows
+
+
+def load_fx_rates(path):
+    """Upsert the rates in the CSV at path; returns the number of daily rows written."""
+    rates = {}
+    with open(path, newline="") as f:
+        for line in csv.DictReader(f):
+            currency = line["currency"].strip().upper()
+            if currency == BASE_CURRENCY:
+                continue
+            rates[(currency, date.fromisoformat(line["date"].strip()))] = float(line["rate"])
+
+    rows = _forward_fill(rates)
+    conn = get_conn(); cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO fx_rates (currency, date, rate) VALUES (?, ?, ?)
+        ON CONFLICT(currency, date) DO UPDATE SET rate=excluded.rate
+    """, rows)
+    conn.commit(); conn.close()
+
+    # this process's memoized rates; other processes re-read theirs within
+    # FX_RATE_TTL seconds
+    _fx_rate.cache_clear()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python fx.py rates.csv")
+    init_db()
+    print(f"loaded {load_fx_rates(sys.argv[1])} daily rates")
@@ -0,0 +1,56 @@
+# gunicorn.conf.py - used by: gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# the usual (2 x cores) + 1: requests here mostly wait on SQLite / outside APIs
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "2"))
+
+# /api/stream keeps one connection open per open dashboard tab. gevent
+# workers hold thousands of those cheaply, so they are the default whenever
+# gevent is installed. Under thread workers each stream would pin a request
+# thread, so the app refuses the stream there (LIVE_STREAM=0, see live.py).
+try:
+    import gevent  # noqa: F401
+    _default_worker_class = "gevent"
+except ImportError:
+    _default_worker_class = "gthread"
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", _default_worker_class)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "2000"))
+os.environ.setdefault("LIVE_STREAM", "1" if worker_class in ("gevent", "eventlet") else "0")
+
+# import the app (and run init_db) once in the master, then fork the workers
+preload_app = True
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# recycle workers now and then so per-process memory can't creep up
+max_requests = 1000
+max_requests_jitter = 100
+
+accesslog = "-"
+errorlog = "-"
+
+
+_jobs_process = None
+
+
+def when_ready(server):
+    # one scheduler + supervised job worker pool for the whole deployment, as
+    # a `python jobs.py` child (see jobs.py); set JOB_WORKERS=0 to run that
+    # under a process manager instead
+    global _jobs_process
+    if os.getenv("JOB_WORKERS") != "0":
+        import jobs
+        _jobs_process = jobs.start_background()
+
+
+def on_exit(server):
+    if _jobs_process is not None:
+        _jobs_process.terminate()
+        _jobs_process.wait(timeout=30)
@@ -0,0 +1,313 @@
+# jobs.py - background job queue persisted in SQLite (table created by init_db)
+#
+# Jobs are claimed by a small pool of worker processes, so heavy work never runs
+# in a request thread. `python jobs.py` runs the scheduler and supervises the
+# pool, restarting any worker that dies. Start it with:
+#
+#   python jobs.py                   (development, next to python app.py; or
+#                                     under systemd & co. with JOB_WORKERS=0
+#                                     for gunicorn)
+#   gunicorn -c gunicorn.conf.py     (spawned by the master, see when_ready)
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+from datetime import datetime
+
+from database import (
+    get_conn, process_recurring_transactions, prune_history, compact_change_log,
+    HISTORY_PRUNE_BATCH,
+)
+from reports import generate_monthly_statement
+
+POLL_INTERVAL = 1.0         # seconds an idle worker sleeps between claims
+SCHEDULER_INTERVAL = 60     # seconds between scheduler ticks
+HEARTBEAT_INTERVAL = 30     # seconds between a running job's locked_at refreshes
+STALE_AFTER = 4 * HEARTBEAT_INTERVAL    # no heartbeat for this long: its worker died
+RETRY_BASE_DELAY = 10       # seconds; doubles with every attempt
+
+
+def prune_history_job():
+    moved = prune_history()
+    if moved >= HISTORY_PRUNE_BATCH:
+        # more left over: keep going in the background, behind other work
+        enqueue("prune_history", priority=-5)
+    return {"moved": moved}
+
+
+def compact_change_log_job():
+    return {"removed": compact_change_log()}
+
+
+# name -> callable(**args) returning something JSON-serializable
+JOB_HANDLERS = {
+    "process_recurring": process_recurring_transactions,
+    "monthly_statement": generate_monthly_statement,
+    "prune_history": prune_history_job,
+    "compact_change_log": compact_change_log_job,
+}
+
+# (name, args, interval seconds) kept queued by the scheduler
+PERIODIC_JOBS = [
+    ("process_recurring", {}, 60 * 60),
+    ("prune_history", {}, 10 * 60),
+    ("compact_change_log", {}, 60 * 60),
+]
+
+
+def _encode_args(args):
+    return json.dumps(args or {}, sort_keys=True)
+
+
+# ---------------- QUEUE ----------------
+def enqueue(name, args=None, priority=0, delay=0, max_attempts=3):
+    """
+    Queue a job and return its id. An identical job (same name and args) that
+    is still waiting is reused instead of queueing a duplicate; it keeps the
+    higher of the two priorities and the earlier run time. While an identical
+    job is running its id is returned and nothing is queued, so the same work
+    never runs twice at once.
+    """
+    if name not in JOB_HANDLERS:
+        raise ValueError(f"unknown job {name!r}")
+
+    encoded = _encode_args(args)
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("""
+        INSERT OR IGNORE INTO jobs (name, args, priority, max_attempts, run_at)
+        VALUES (?, ?, ?, ?, datetime('now', ?))
+    """, (name, encoded, priority, max_attempts, f"+{int(delay)} seconds"))
+
+    if cur.rowcount:
+        job_id = cur.lastrowid
+    else:
+        cur.execute("""
+            UPDATE jobs SET priority=MAX(priority, ?), run_at=MIN(run_at, datetime('now', ?))
+            WHERE name=? AND args=? AND status='queued'
+        """, (priority, f"+{int(delay)} seconds", name, encoded))
+        cur.execute("""
+            SELECT id FROM jobs WHERE name=? AND args=? AND status IN ('queued', 'running')
+        """, (name, encoded))
+        job_id = cur.fetchone()["id"]
+
+    conn.commit(); conn.close()
+    return job_id
+
+
+def get_job(job_id):
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("SELECT * FROM jobs WHERE id=?", (job_id,))
+    r = cur.fetchone(); conn.close()
+    return r
+
+
+def find_job(name, args=None):
+    """Most recent job with this name and args that has not failed, if any."""
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("""
+        SELECT * FROM jobs WHERE name=? AND args=? AND status != 'failed'
+        ORDER BY id DESC LIMIT 1
+    """, (name, _encode_args(args)))
+    r = cur.fetchone(); conn.close()
+    return r
+
+
+def job_status(job):
+    """Public (JSON-friendly) view of a job row."""
+    return {
+        "id": job["id"],
+        "name": job["name"],
+        "args": json.loads(job["args"]),
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "result": json.loads(job["result"]) if job["result"] else None,
+        "error": job["error"].strip().splitlines()[-1] if job["error"] else None,
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+def claim_job():
+    """Atomically take the next runnable job, or return None."""
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("""
+            SELECT * FROM jobs
+            WHERE status='queued' AND run_at <= datetime('now')
+            ORDER BY priority DESC, run_at, id LIMIT 1
+        """)
+        job = cur.fetchone()
+        if job:
+            cur.execute("""
+                UPDATE jobs SET status='running', attempts=attempts+1, locked_at=datetime('now')
+                WHERE id=?
+            """, (job["id"],))
+        conn.commit()
+        return job
+    except sqlite3.OperationalError:
+        # another worker holds the write lock; try again on the next poll
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+
+def _finish(job_id, status, result=None, error=None):
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("""
+        UPDATE jobs SET status=?, result=?, error=?, locked_at=NULL, finished_at=datetime('now')
+        WHERE id=?
+    """, (status, result, error, job_id))
+    conn.commit(); conn.close()
+
+
+def _retry_later(job, error):
+    delay = RETRY_BASE_DELAY * 2 ** job["attempts"]
+    conn = get_conn(); cur = conn.cursor()
+    # still the only active copy (see idx_jobs_active), so this can't conflict
+    cur.execute("""
+        UPDATE jobs SET status='queued', error=?, locked_at=NULL, run_at=datetime('now', ?)
+        WHERE id=?
+    """, (error, f"+{delay} seconds", job["id"]))
+    conn.commit(); conn.close()
+
+
+def _heartbeat(job_id, stop):
+    # keeps locked_at fresh for as long as the job runs, however long that
+    # is, so requeue_stale_jobs only ever picks up jobs whose worker died
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            conn = get_conn()
+            conn.execute("UPDATE jobs SET locked_at=datetime('now') WHERE id=? AND status='running'", (job_id,))
+            conn.commit(); conn.close()
+        except sqlite3.OperationalError:
+            pass    # database busy: the next beat is well within STALE_AFTER
+
+
+def run_job(job):
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(job["id"], stop), daemon=True)
+    beat.start()
+    try:
+        args = json.loads(job["args"])
+        result = JOB_HANDLERS[job["name"]](**args)
+    except Exception:
+        error = traceback.format_exc()
+        # attempts already counts this run (incremented by claim_job)
+        if job["attempts"] + 1 < job["max_attempts"]:
+            _retry_later(job, error)
+        else:
+            _finish(job["id"], "failed", error=error)
+        return
+    finally:
+        stop.set()
+        beat.join()
+    _finish(job["id"], "done", result=json.dumps(result))
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker died mid-run (no heartbeat for STALE_AFTER)."""
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("""
+        UPDATE jobs SET status='queued', locked_at=NULL
+        WHERE status='running' AND locked_at < datetime('now', ?)
+    """, (f"-{STALE_AFTER} seconds",))
+    conn.commit(); conn.close()
+
+
+# ---------------- SCHEDULER ----------------
+def _previous_month():
+    today = datetime.now().date()
+    return f"{today.year - 1}-12" if today.month == 1 else f"{today.year}-{today.month - 1:02d}"
+
+
+def schedule_due_jobs():
+    # periodic jobs: once the last run is done, queue the next one with a
+    # future run_at; while it waits (or runs) there is nothing to do
+    for name, args, interval in PERIODIC_JOBS:
+        last = find_job(name, args)
+        if last is None:
+            enqueue(name, args)
+        elif last["status"] == "done":
+            enqueue(name, args, delay=interval)
+
+    # last month's statement, once
+    args = {"month": _previous_month()}
+    if not find_job("monthly_statement", args):
+        enqueue("monthly_statement", args, priority=-1)
+
+    requeue_stale_jobs()
+
+
+# ---------------- WORKERS ----------------
+def worker_loop():
+    parent = os.getppid()
+    # the supervisor is gone (killed): stop taking jobs instead of running
+    # unsupervised next to the replacement pool
+    while os.getppid() == parent:
+        job = claim_job()
+        if job:
+            run_job(job)
+        else:
+            time.sleep(POLL_INTERVAL)
+
+
+def _start_worker(i):
+    p = multiprocessing.Process(target=worker_loop, name=f"jobs-worker-{i}", daemon=True)
+    p.start()
+    return p
+
+
+def run_background(workers=None):
+    """
+    Run the scheduler in this process and keep `workers` worker processes
+    alive, restarting any that exits. Blocks until SIGTERM / SIGINT.
+    """
+    workers = workers or int(os.getenv("JOB_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+    # exit through sys.exit so multiprocessing stops the (daemon) workers
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    pool = [_start_worker(i) for i in range(workers)]
+    next_tick = 0
+    while True:
+        if time.monotonic() >= next_tick:
+            try:
+                schedule_due_jobs()
+            except Exception:
+                # e.g. database busy: a missed tick is retried, a dead
+                # scheduler would stop periodic jobs and stale requeues
+                traceback.print_exc()
+            next_tick = time.monotonic() + SCHEDULER_INTERVAL
+
+        # sleep until the next tick or until a worker exits
+        wait([p.sentinel for p in pool], timeout=max(0, next_tick - time.monotonic()))
+        for i, p in enumerate(pool):
+            if not p.is_alive():
+                print(f"jobs: {p.name} exited ({p.exitcode}), restarting", file=sys.stderr)
+                pool[i] = _start_worker(i)
+
+
+def start_background(workers=None):
+    """
+    Spawn `python jobs.py` (scheduler + supervised pool) as a child process
+    and return its Popen; used by gunicorn's master, see gunicorn.conf.py.
+    """
+    env = dict(os.environ)
+    if workers:
+        env["JOB_WORKERS"] = str(workers)
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+
+if __name__ == "__main__":
+    from database import init_db
+
+    init_db()
+    run_background()
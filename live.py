@@ -0,0 +1,140 @@
+# live.py - server-sent events push channel (/api/stream)
+#
+# One publisher thread per worker process tails change_log (written by the
+# database triggers, so it sees writes from every process) and checks for due
+# event reminders, then fans compact events out to per-user subscribers.
+# Subscribers are just a bounded deque plus a threading.Event, so an idle
+# connection costs almost nothing beyond its socket; run the app under
+# gevent workers (GUNICORN_WORKER_CLASS=gevent) to hold thousands of them.
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from database import get_conn
+
+POLL_INTERVAL = 1.0         # seconds between change_log / reminder polls
+HEARTBEAT_INTERVAL = 15     # seconds of silence before a keep-alive comment
+CLIENT_BUFFER = 100         # events buffered per client before it must resync
+REMINDER_FORMAT = "%Y-%m-%dT%H:%M"  # as submitted by <input type="datetime-local">
+
+
+def stream_enabled():
+    """
+    False when the server runs on a fixed pool of request threads (set by
+    gunicorn.conf.py / wsgi.py), where every open stream would hold one.
+    """
+    return os.getenv("LIVE_STREAM", "1") == "1"
+
+
+class Subscriber:
+    __slots__ = ("user_id", "queue", "wakeup", "overflowed")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.queue = deque(maxlen=CLIENT_BUFFER)
+        self.wakeup = threading.Event()
+        self.overflowed = False
+
+    def push(self, event):
+        if len(self.queue) == self.queue.maxlen:
+            # a slow client loses the oldest events and is told to resync
+            self.overflowed = True
+        self.queue.append(event)
+        self.wakeup.set()
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds, then return (events, overflowed)."""
+        self.wakeup.wait(timeout)
+        self.wakeup.clear()
+        events = []
+        while self.queue:
+            events.append(self.queue.popleft())
+        overflowed, self.overflowed = self.overflowed, False
+        return events, overflowed
+
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}      # user_id -> set of Subscriber
+        self._thread = None
+        self._version = None        # last change_log version fanned out
+        self._reminders_until = None
+
+    def subscribe(self, user_id):
+        sub = Subscriber(user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(sub)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-publisher", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, user_id, event):
+        """Send event to one user's connections, or everyone's if user_id is None."""
+        with self._lock:
+            if user_id is None:
+                targets = [s for subs in self._subscribers.values() for s in subs]
+            else:
+                targets = list(self._subscribers.get(user_id, ()))
+        for sub in targets:
+            sub.push(event)
+
+    # ---------------- PUBLISHER ----------------
+    def _run(self):
+        while True:
+            time.sleep(POLL_INTERVAL)
+            try:
+                self._poll()
+            except Exception:
+                # a locked / busy database just delays this round
+                pass
+
+    def _poll(self):
+        conn = get_conn(); cur = conn.cursor()
+        try:
+            if self._version is None:
+                # start from "now": history is what /api/changes is for
+                cur.execute("SELECT COALESCE(MAX(version), 0) AS v FROM change_log")
+                self._version = cur.fetchone()["v"]
+
+            cur.execute("""
+                SELECT version, table_name, row_id, op, user_id FROM change_log
+                WHERE version > ? ORDER BY version LIMIT 1000
+            """, (self._version,))
+            for c in cur.fetchall():
+                self._version = c["version"]
+                self.publish(c["user_id"], ("change", c["version"], {
+                    "table": c["table_name"], "id": c["row_id"], "op": c["op"],
+                }))
+
+            now = datetime.now().strftime(REMINDER_FORMAT)
+            if self._reminders_until is not None and now > self._reminders_until:
+                cur.execute("""
+                    SELECT id, user_id, title, date, time, reminder_at FROM events
+                    WHERE reminder_at > ? AND reminder_at <= ?
+                """, (self._reminders_until, now))
+                for r in cur.fetchall():
+                    self.publish(r["user_id"], ("reminder", None, {
+                        "id": r["id"], "title": r["title"], "date": r["date"], "time": r["time"],
+                    }))
+            self._reminders_until = now
+        finally:
+            conn.close()
+
+
+hub = Hub()
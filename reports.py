@@ -0,0 +1,72 @@
+# reports.py - monthly statements, generated by the background job queue
+import csv
+import os
+import calendar
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from database import (
+    get_transactions, get_totals_by_month, get_category_totals,
+    convert_amount, format_money, BASE_CURRENCY,
+)
+
+STATEMENTS_DIR = "statements"
+
+_env = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")),
+    autoescape=select_autoescape(["html"])
+)
+_env.filters["money"] = format_money
+
+
+def statement_path(month, fmt):
+    return os.path.join(STATEMENTS_DIR, f"statement-{month}.{fmt}")
+
+
+def generate_monthly_statement(month):
+    """
+    Write statements/statement-YYYY-MM.csv and .html for the given month.
+    Returns the written paths.
+    """
+    year, m = map(int, month.split("-"))
+    last_day = calendar.monthrange(year, m)[1]
+    rows = get_transactions(limit=-1, filters={
+        "date_from": f"{month}-01",
+        "date_to": f"{month}-{last_day:02d}",
+    })
+    # oldest first, each with its amount in BASE_CURRENCY (None without a rate)
+    rows = [
+        dict(r, base_amount=convert_amount(r["amount"], r["currency"], r["date"]))
+        for r in reversed(rows)
+    ]
+
+    os.makedirs(STATEMENTS_DIR, exist_ok=True)
+
+    csv_path = statement_path(month, "csv")
+    with open(csv_path + ".tmp", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "date", "type", "category", "amount", "currency", f"amount_{BASE_CURRENCY.lower()}",
+            "payment_method", "description",
+        ])
+        for r in rows:
+            writer.writerow([
+                r["date"], r["type"], r["category"], r["amount"], r["currency"], r["base_amount"],
+                r["payment_method"], r["description"],
+            ])
+    os.replace(csv_path + ".tmp", csv_path)
+
+    names, totals = get_category_totals(month)
+    html_path = statement_path(month, "html")
+    html = _env.get_template("statement.html").render(
+        month=month,
+        base_currency=BASE_CURRENCY,
+        transactions=rows,
+        totals=get_totals_by_month(month),
+        categories=[(n, t) for n, t in zip(names, totals) if t]
+    )
+    with open(html_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(html)
+    os.replace(html_path + ".tmp", html_path)
+
+    return {"csv": csv_path, "html": html_path, "transactions": len(rows)}
@@ -0,0 +1,22 @@
+# wsgi.py - production entry point
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app      (Linux / macOS)
+#   python wsgi.py                            (waitress, works on Windows)
+import os
+
+from app import create_app
+
+app = create_app()
+
+if __name__ == "__main__":
+    from waitress import serve
+
+    # waitress has a fixed thread pool; don't let live streams pin it
+    os.environ.setdefault("LIVE_STREAM", "0")
+
+    serve(
+        app,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        threads=int(os.getenv("WAITRESS_THREADS", (os.cpu_count() or 1) * 4)),
+    )